@@ -6,10 +6,33 @@ import os
 from datetime import datetime
 from scipy import stats
 import uuid
+import hashlib
+import heapq
+import re
+import zlib
+import sqlite3
+import sys
+import threading
+import atexit
+from abc import ABC, abstractmethod
+import copy
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import math
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 import logging
 import time
+import random
 import requests
-from typing import Dict, List, Optional, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Iterator, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -211,17 +234,813 @@ def apply_futuristic_style():
     """, unsafe_allow_html=True)
 
 # ==================== DATABASE SYSTEM ====================
+def participant_summary(participant_id: str, data: Dict) -> Dict:
+    demographics = data.get('demographics', {})
+    progress = data.get('learning_progress', {})
+    return {
+        'participant_id': participant_id,
+        'nama': demographics.get('nama', 'Unknown'),
+        'kelas': demographics.get('kelas', 'Unknown'),
+        'usia': demographics.get('usia', 0),
+        'pengalaman': demographics.get('pengalaman', 'Unknown'),
+        'pre_anxiety': data.get('anxiety_survey', {}).get('pre_score'),
+        'post_anxiety': data.get('anxiety_survey', {}).get('post_score'),
+        'pre_score': data.get('pre_test', {}).get('score'),
+        'post_score': data.get('post_test', {}).get('score'),
+        'problems_attempted': progress.get('problems_attempted', 0),
+        'problems_correct': progress.get('problems_correct', 0),
+        # Free text stays in the document; load_participant fetches it on demand
+        'has_testimonial': bool(data.get('satisfaction_survey', {}).get('testimonial'))
+    }
+
+def _id_number(participant_id: str) -> int:
+    digits = participant_id[1:] if participant_id.startswith('P') else ''
+    return int(digits) if digits.isdigit() else 0
+
+class _FileLock:
+    # Exclusive advisory lock on a side file, shared by threads and processes
+    _thread_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            os.close(self._fd)
+        finally:
+            self._thread_lock.release()
+
+class StorageBackend(ABC):
+    # Raw participant storage. A snapshot is the full participant document; the
+    # journal holds practice attempts recorded after that snapshot was written.
+    # Writing a snapshot drops journal records up to its journal_seq.
+    @abstractmethod
+    def write_snapshot(self, participant_id: str, data: Dict):
+        ...
+
+    @abstractmethod
+    def read_snapshot(self, participant_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def append_journal(self, participant_id: str, record: Dict):
+        ...
+
+    @abstractmethod
+    def read_journal(self, participant_id: str) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def list_ids(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def version_token(self, participant_id: str):
+        # Cheap value that changes whenever the snapshot or journal changes
+        ...
+
+    @abstractmethod
+    def modified_since(self, timestamp: float) -> List[str]:
+        ...
+
+    def count(self) -> int:
+        return len(self.list_ids())
+
+    @abstractmethod
+    def allocate_id(self) -> int:
+        ...
+
+    def summary_rows(self) -> Optional[List[Dict]]:
+        # Backends without analytic columns fall back to loading every document
+        return None
+
+class JSONFileBackend(StorageBackend):
+    # Documents live in shards/<first two hex digits of md5(pid)>/ and the
+    # append-only _manifest.txt lists every participant, so enumeration never
+    # has to scan a directory.
+    SHARD_DIR = "shards"
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.shard_root = os.path.join(self.data_dir, self.SHARD_DIR)
+        self.manifest_path = os.path.join(self.data_dir, "_manifest.txt")
+        os.makedirs(self.shard_root, exist_ok=True)
+        self._manifest_lock = threading.Lock()
+        self._known: Dict[str, None] = {}
+        self._manifest_offset = 0
+        self._migrate_flat_layout()
+
+    def _shard_dir(self, participant_id: str) -> str:
+        shard = hashlib.md5(participant_id.encode('utf-8')).hexdigest()[:2]
+        return os.path.join(self.shard_root, shard)
+
+    def _snapshot_path(self, participant_id: str) -> str:
+        return os.path.join(self._shard_dir(participant_id), f"{participant_id}.json")
+
+    def _journal_path(self, participant_id: str) -> str:
+        return os.path.join(self._shard_dir(participant_id), f"{participant_id}.journal.jsonl")
+
+    def _iter_shard_entries(self) -> Iterator[os.DirEntry]:
+        with os.scandir(self.shard_root) as shards:
+            shard_dirs = [entry.path for entry in shards if entry.is_dir()]
+        for shard_dir in shard_dirs:
+            with os.scandir(shard_dir) as entries:
+                yield from entries
+
+    def _refresh_manifest(self):
+        with self._manifest_lock:
+            if not os.path.exists(self.manifest_path):
+                # Lost or never written: rebuild it once from the shard directories
+                ids = [e.name[:-len('.json')] for e in self._iter_shard_entries() if e.name.endswith('.json')]
+                tmp_path = f"{self.manifest_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(f"{pid}\n" for pid in ids)
+                os.replace(tmp_path, self.manifest_path)
+                self._known = dict.fromkeys(ids)
+                self._manifest_offset = 0
+            if os.path.getsize(self.manifest_path) == self._manifest_offset:
+                return
+            # Other processes append too, so read whatever was added since last time
+            with open(self.manifest_path, 'rb') as f:
+                f.seek(self._manifest_offset)
+                chunk = f.read()
+            complete = chunk[:chunk.rfind(b'\n') + 1]
+            for line in complete.decode('utf-8').splitlines():
+                if line:
+                    self._known[line] = None
+            self._manifest_offset += len(complete)
+
+    def _register(self, participant_id: str):
+        if participant_id in self._known:
+            return
+        self._refresh_manifest()
+        with self._manifest_lock:
+            if participant_id in self._known:
+                return
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(f"{participant_id}\n")
+            self._known[participant_id] = None
+
+    def _migrate_flat_layout(self):
+        # Online migration from research_data/<pid>.json: resumable, and safe to
+        # run from several processes at once thanks to the lock
+        def flat_files():
+            return [
+                name for name in os.listdir(self.data_dir)
+                if not name.startswith('_') and (name.endswith('.json') or name.endswith('.journal.jsonl'))
+            ]
+        if not flat_files():
+            return
+        with _FileLock(os.path.join(self.data_dir, "_migration.lock")):
+            moved = 0
+            for name in flat_files():
+                is_journal = name.endswith('.journal.jsonl')
+                pid = name[:-len('.journal.jsonl')] if is_journal else name[:-len('.json')]
+                # Listed before the move: a crash in between leaves an entry the next run completes
+                self._register(pid)
+                os.makedirs(self._shard_dir(pid), exist_ok=True)
+                target = self._journal_path(pid) if is_journal else self._snapshot_path(pid)
+                os.replace(os.path.join(self.data_dir, name), target)
+                moved += 1
+            logger.info(f"Migrated {moved} files to sharded layout in {self.shard_root}")
+
+    def write_snapshot(self, participant_id: str, data: Dict):
+        self._register(participant_id)
+        os.makedirs(self._shard_dir(participant_id), exist_ok=True)
+        file_path = self._snapshot_path(participant_id)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+        journal_path = self._journal_path(participant_id)
+        if os.path.exists(journal_path):
+            # Attempts journaled after this snapshot was taken must survive
+            applied = data.get('journal_seq', 0)
+            remaining = [r for r in self.read_journal(participant_id) if r['s'] > applied]
+            if remaining:
+                with open(f"{journal_path}.tmp", 'w', encoding='utf-8') as f:
+                    f.writelines(json.dumps(r, separators=(',', ':')) + '\n' for r in remaining)
+                os.replace(f"{journal_path}.tmp", journal_path)
+            else:
+                os.remove(journal_path)
+
+    def read_snapshot(self, participant_id: str) -> Optional[Dict]:
+        file_path = self._snapshot_path(participant_id)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def append_journal(self, participant_id: str, record: Dict):
+        with open(self._journal_path(participant_id), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def read_journal(self, participant_id: str) -> List[Dict]:
+        journal_path = self._journal_path(participant_id)
+        if not os.path.exists(journal_path):
+            return []
+        records = []
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn write at the tail of the journal
+                    logger.warning(f"Skipping corrupt journal record for {participant_id}")
+        return records
+
+    def list_ids(self) -> List[str]:
+        self._refresh_manifest()
+        return list(self._known)
+
+    def count(self) -> int:
+        self._refresh_manifest()
+        return len(self._known)
+
+    def version_token(self, participant_id: str):
+        token = []
+        for path in (self._snapshot_path(participant_id), self._journal_path(participant_id)):
+            try:
+                info = os.stat(path)
+                token.append((info.st_mtime_ns, info.st_size))
+            except FileNotFoundError:
+                token.append(None)
+        return tuple(token)
+
+    def modified_since(self, timestamp: float) -> List[str]:
+        # Enumerates through the manifest like list_ids; only the participant's
+        # own snapshot and journal are stat'ed, never a shard directory listing
+        since_ns = int(timestamp * 1e9)
+        return [
+            pid for pid in self.list_ids()
+            if any(part is not None and part[0] >= since_ns for part in self.version_token(pid))
+        ]
+
+    def allocate_id(self) -> int:
+        counter_path = os.path.join(self.data_dir, "_participant_counter")
+        with _FileLock(f"{counter_path}.lock"):
+            if os.path.exists(counter_path):
+                with open(counter_path, 'r', encoding='utf-8') as f:
+                    last = int(f.read().strip() or 0)
+            else:
+                # First allocation on an existing directory: continue after the highest ID
+                last = max((_id_number(pid) for pid in self.list_ids()), default=0)
+            tmp_path = f"{counter_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(str(last + 1))
+            os.replace(tmp_path, counter_path)
+            return last + 1
+
+class SQLiteBackend(StorageBackend):
+    SUMMARY_COLUMNS = [
+        'nama', 'kelas', 'usia', 'pengalaman', 'pre_anxiety', 'post_anxiety',
+        'pre_score', 'post_score', 'problems_attempted', 'problems_correct'
+    ]
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        # One connection per Streamlit session thread; WAL lets readers run alongside the writer
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS participants (
+                    participant_id TEXT PRIMARY KEY,
+                    doc TEXT NOT NULL,
+                    nama TEXT,
+                    kelas TEXT,
+                    usia INTEGER,
+                    pengalaman TEXT,
+                    pre_anxiety REAL,
+                    post_anxiety REAL,
+                    pre_score INTEGER,
+                    post_score INTEGER,
+                    problems_attempted INTEGER,
+                    problems_correct INTEGER,
+                    testimonial TEXT,
+                    last_updated TEXT
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS attempts (
+                    participant_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    record TEXT NOT NULL,
+                    PRIMARY KEY (participant_id, seq)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )""")
+            for column in ['kelas', 'pengalaman', 'pre_score', 'post_score', 'pre_anxiety', 'post_anxiety']:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_participants_{column} ON participants ({column})")
+
+    def write_snapshot(self, participant_id: str, data: Dict):
+        summary = participant_summary(participant_id, data)
+        values = [summary[c] for c in self.SUMMARY_COLUMNS]
+        testimonial = data.get('satisfaction_survey', {}).get('testimonial', '')
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO participants (participant_id, doc, {', '.join(self.SUMMARY_COLUMNS)}, testimonial, last_updated) "
+                f"VALUES (?, ?, {', '.join('?' * len(self.SUMMARY_COLUMNS))}, ?, ?)",
+                [participant_id, json.dumps(data, ensure_ascii=False), *values, testimonial, data.get('last_updated')]
+            )
+            conn.execute(
+                "DELETE FROM attempts WHERE participant_id = ? AND seq <= ?",
+                (participant_id, data.get('journal_seq', 0))
+            )
+
+    def read_snapshot(self, participant_id: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT doc FROM participants WHERE participant_id = ?", (participant_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def append_journal(self, participant_id: str, record: Dict):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO attempts (participant_id, seq, record) VALUES (?, ?, ?)",
+                (participant_id, record['s'], json.dumps(record, separators=(',', ':')))
+            )
+
+    def read_journal(self, participant_id: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT record FROM attempts WHERE participant_id = ? ORDER BY seq", (participant_id,)
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def list_ids(self) -> List[str]:
+        return [r[0] for r in self._conn().execute("SELECT participant_id FROM participants")]
+
+    def version_token(self, participant_id: str):
+        return self._conn().execute("""
+            SELECT last_updated, (SELECT COALESCE(MAX(seq), 0) FROM attempts WHERE participant_id = ?)
+            FROM participants WHERE participant_id = ?""", (participant_id, participant_id)).fetchone()
+
+    def modified_since(self, timestamp: float) -> List[str]:
+        since = datetime.fromtimestamp(timestamp).isoformat()
+        rows = self._conn().execute("""
+            SELECT participant_id FROM participants WHERE last_updated >= ?
+            UNION
+            SELECT participant_id FROM attempts WHERE json_extract(record, '$.t') >= ?""", (since, since))
+        return [r[0] for r in rows]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM participants").fetchone()[0]
+
+    def allocate_id(self) -> int:
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent allocators serialize
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM counters WHERE name = 'participant'").fetchone()
+            if row:
+                last = row[0]
+            else:
+                last = max((_id_number(pid) for pid in self.list_ids()), default=0)
+            conn.execute(
+                "INSERT OR REPLACE INTO counters (name, value) VALUES ('participant', ?)", (last + 1,)
+            )
+            conn.execute("COMMIT")
+            return last + 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def summary_rows(self) -> List[Dict]:
+        # Journaled attempts are not yet in the snapshot columns, so fold them in here
+        cursor = self._conn().execute(f"""
+            SELECT p.participant_id, {', '.join('p.' + c for c in self.SUMMARY_COLUMNS)},
+                   COALESCE(p.testimonial, '') != '', COALESCE(j.attempted, 0), COALESCE(j.correct, 0)
+            FROM participants p
+            LEFT JOIN (
+                SELECT participant_id, COUNT(*) AS attempted,
+                       SUM(json_extract(record, '$.ok')) AS correct
+                FROM attempts GROUP BY participant_id
+            ) j ON j.participant_id = p.participant_id
+            ORDER BY p.participant_id""")
+        rows = []
+        for r in cursor:
+            row = dict(zip(['participant_id', *self.SUMMARY_COLUMNS, 'has_testimonial'], r[:-2]))
+            row['has_testimonial'] = bool(row['has_testimonial'])
+            row['problems_attempted'] = (row['problems_attempted'] or 0) + r[-2]
+            row['problems_correct'] = (row['problems_correct'] or 0) + r[-1]
+            rows.append(row)
+        return rows
+
+class CohortIndex:
+    # Materialized summary rows plus running sums of the paired pre/post values,
+    # kept current by RealTimeDatabase so analytics never rescan the cohort.
+    # Every process persists to the same file: rows another process wrote are
+    # merged in (re-read from storage where they disagree) rather than
+    # overwritten, and 'writers' records how far each writer's saves are
+    # reflected so a cold start knows where to resume catching up.
+    PAIRS = {
+        'anxiety': ('pre_anxiety', 'post_anxiety'),
+        'score': ('pre_score', 'post_score')
+    }
+    PERSIST_INTERVAL = 5.0
+    # Bump when the row layout changes; an index in an older format is rebuilt
+    FORMAT = 2
+
+    def __init__(self, path: str, reload_row=None):
+        self.path = path
+        # reload_row(pid) returns the current summary row from storage
+        self.reload_row = reload_row
+        self.writer = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self.rows: Dict[str, Dict] = {}
+        self.totals = self._empty_totals()
+        self.version = 0
+        # Bumped only when a row's pre/post columns change (not on practice
+        # answers), so paired analytics can be cached across ordinary saves
+        self.paired_version = 0
+        self._dirty = False
+        # Persisting runs on a background thread so no saving request pays for it
+        self._persist_lock = threading.Lock()
+        self._dirty_event = threading.Event()
+        self._persister = None
+        # Every save made before this time is reflected in our rows
+        self._loaded_at: Optional[float] = None
+        self._written_stat = None
+        self._writers: Dict[str, float] = {}
+
+    @classmethod
+    def _empty_totals(cls) -> Dict[str, List[float]]:
+        # n, sum pre, sum post, sum (pre - post), sum (pre - post)^2
+        return {name: [0, 0.0, 0.0, 0.0, 0.0] for name in cls.PAIRS}
+
+    @staticmethod
+    def _number(value) -> Optional[float]:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+            return None
+        return float(value)
+
+    def _apply(self, row: Dict, sign: int):
+        for name, (pre_key, post_key) in self.PAIRS.items():
+            pre, post = self._number(row.get(pre_key)), self._number(row.get(post_key))
+            if pre is None or post is None:
+                continue
+            diff = pre - post
+            totals = self.totals[name]
+            totals[0] += sign
+            totals[1] += sign * pre
+            totals[2] += sign * post
+            totals[3] += sign * diff
+            totals[4] += sign * diff * diff
+
+    def _replace(self, row: Dict):
+        old = self.rows.get(row['participant_id'])
+        if old is not None:
+            self._apply(old, -1)
+        self._apply(row, 1)
+        self.rows[row['participant_id']] = row
+        self.version += 1
+        if old is None or any(old.get(c) != row.get(c) for pair in self.PAIRS.values() for c in pair):
+            self.paired_version += 1
+
+    def update(self, row: Dict):
+        with self._lock:
+            self._replace(row)
+            self._dirty = True
+            self._dirty_event.set()
+            if self._persister is None:
+                self._persister = threading.Thread(target=self._persist_loop, name="cohort-index-persister", daemon=True)
+                self._persister.start()
+
+    def _persist_loop(self):
+        while True:
+            self._dirty_event.wait()
+            # Batch all updates of the interval into one write
+            time.sleep(self.PERSIST_INTERVAL)
+            self.persist()
+
+    @classmethod
+    def _complete_pairs(cls, rows: List[Dict]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        # Pre/post arrays per pair, restricted to complete cases
+        frame = pd.DataFrame.from_records(rows, columns=[c for pair in cls.PAIRS.values() for c in pair])
+        pairs = {}
+        for name, (pre_key, post_key) in cls.PAIRS.items():
+            # bool is excluded to match _number; anything non-numeric becomes NaN
+            pre = pd.to_numeric(frame[pre_key].where(frame[pre_key].map(type) != bool), errors='coerce').to_numpy(float)
+            post = pd.to_numeric(frame[post_key].where(frame[post_key].map(type) != bool), errors='coerce').to_numpy(float)
+            complete = np.isfinite(pre) & np.isfinite(post)
+            pairs[name] = (pre[complete], post[complete])
+        return pairs
+
+    @classmethod
+    def _frame_totals(cls, rows: List[Dict]) -> Dict[str, List[float]]:
+        totals = cls._empty_totals()
+        if not rows:
+            return totals
+        for name, (pre, post) in cls._complete_pairs(rows).items():
+            diff = pre - post
+            totals[name] = [len(diff), float(pre.sum()), float(post.sum()), float(diff.sum()), float(diff @ diff)]
+        return totals
+
+    def paired_differences(self, name: str) -> np.ndarray:
+        # pre - post for every complete case
+        with self._lock:
+            rows = list(self.rows.values())
+        pre, post = self._complete_pairs(rows)[name]
+        return pre - post
+
+    def rebuild(self, rows: List[Dict], as_of: Optional[float] = None):
+        # as_of: when reading rows from storage began
+        totals = self._frame_totals(rows)
+        with self._lock:
+            self._loaded_at = as_of if as_of is not None else time.time()
+            self.rows = {row['participant_id']: row for row in rows}
+            self.totals = totals
+            self.version += 1
+            self.paired_version += 1
+            self._dirty = True
+        # Outside the index lock: persist() takes _persist_lock before _lock
+        self.persist()
+
+    def paired_stats(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            n, sum_pre, sum_post, sum_d, sum_d2 = self.totals[name]
+        if n < 2:
+            return None
+        mean_d = sum_d / n
+        var_d = max(sum_d2 - n * mean_d * mean_d, 0.0) / (n - 1)
+        if var_d > 0:
+            t_value = mean_d / math.sqrt(var_d / n)
+            p_value = float(2 * stats.t.sf(abs(t_value), n - 1))
+        else:
+            t_value, p_value = float('nan'), float('nan')
+        return {
+            'n': n,
+            'mean_pre': sum_pre / n,
+            'mean_post': sum_post / n,
+            'mean_diff': mean_d,
+            't': t_value,
+            'p': p_value
+        }
+
+    def _file_stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            info = os.stat(self.path)
+            return (info.st_ino, info.st_mtime_ns, info.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _read_state(self) -> Optional[Dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable cohort index: {e}")
+            return None
+        if state.get('format') != self.FORMAT:
+            logger.info("Cohort index format changed; rebuilding")
+            return None
+        return state
+
+    def _merge(self, rows: List[Dict]) -> int:
+        # Rows that differ from ours were written by another process (or by us
+        # since); storage decides which is current
+        merged = 0
+        for row in rows:
+            pid = row['participant_id']
+            ours = self.rows.get(pid)
+            if ours == row:
+                continue
+            current = self.reload_row(pid) if self.reload_row else row
+            if current is None:
+                continue
+            with self._lock:
+                # A local update that raced the re-read is newer still
+                if self.rows.get(pid) is ours:
+                    self._replace(current)
+                    merged += 1
+        if merged:
+            logger.info(f"Merged {merged} cohort index rows persisted by other processes")
+        return merged
+
+    def persist(self, final: bool = False):
+        # _persist_lock keeps this process's writes in order; the index lock is
+        # held only for the shallow copy (rows are replaced on update, never
+        # mutated). The file is replaced only if no other process replaced it
+        # since we read it, otherwise we merge again. final drops this writer.
+        with self._persist_lock:
+            if self._loaded_at is None:
+                return
+            tmp_path = f"{self.path}.{self.writer}.tmp"
+            while True:
+                seen = self._file_stat()
+                if seen is not None and seen != self._written_stat:
+                    disk = self._read_state()
+                    if disk is not None:
+                        self._merge(disk['rows'])
+                        self._writers = disk.get('writers', {})
+                with self._lock:
+                    if not self._dirty and not final:
+                        return
+                    state = {
+                        'format': self.FORMAT,
+                        'version': self.version,
+                        'totals': {name: list(values) for name, values in self.totals.items()},
+                        'rows': list(self.rows.values())
+                    }
+                    self._dirty = False
+                    self._dirty_event.clear()
+                # Our rows reflect every save made before we loaded, whoever made it
+                now = time.time()
+                writers = {w: max(t, self._loaded_at) for w, t in self._writers.items() if w != self.writer}
+                if not final:
+                    writers[self.writer] = now
+                state['writers'] = writers
+                state['saved_at'] = min(writers.values(), default=now)
+                try:
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(json.dumps(state, ensure_ascii=False))
+                    with _FileLock(f"{self.path}.lock"):
+                        replaced = self._file_stat() == seen
+                        if replaced:
+                            os.replace(tmp_path, self.path)
+                            self._written_stat = self._file_stat()
+                except OSError as e:
+                    logger.error(f"Error persisting cohort index: {e}")
+                    return
+                if replaced:
+                    self._writers = writers
+                    return
+                with self._lock:
+                    self._dirty = True
+
+    def load(self) -> Optional[float]:
+        # Returns the time from which saves may be missing from the loaded rows
+        started = time.time()
+        seen = self._file_stat()
+        state = self._read_state() if seen is not None else None
+        if state is None:
+            return None
+        with self._lock:
+            self.rows = {row['participant_id']: row for row in state['rows']}
+            self.totals = state['totals']
+            self.version = state['version']
+            self._loaded_at = started
+            self._written_stat = seen
+            self._writers = state.get('writers', {})
+        return state['saved_at']
+
+class ParticipantCache:
+    # Parsed participant documents shared by every session in the process,
+    # validated against the backend's version token and capped LRU-style.
+    def __init__(self, max_entries: int = 2000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, participant_id: str, token) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(participant_id)
+            if entry is None or entry[0] != token:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(participant_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, participant_id: str, token, data: Dict):
+        with self._lock:
+            self._entries[participant_id] = (token, data)
+            self._entries.move_to_end(participant_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, participant_id: str):
+        with self._lock:
+            self._entries.pop(participant_id, None)
+
 class RealTimeDatabase:
-    def __init__(self):
-        self.data_dir = "research_data"
-        os.makedirs(self.data_dir, exist_ok=True)
+    # Practice attempts are journaled; every N attempts the journal is folded
+    # back into the participant snapshot.
+    JOURNAL_COMPACT_EVERY = 50
+    # Non-critical saves are coalesced and written by a background flusher at
+    # most this many seconds later.
+    WRITE_BEHIND_DELAY = 2.0
+
+    def __init__(self, data_dir: str = "research_data", backend: Optional[str] = None, cache_entries: int = 2000):
+        self.data_dir = data_dir
+        self.cache = ParticipantCache(cache_entries)
+        backend = backend or st.secrets.get("STORAGE_BACKEND", "json")
+        if backend == "sqlite":
+            self.backend = SQLiteBackend(os.path.join(self.data_dir, "easynatorics.sqlite3"))
+        else:
+            self.backend = JSONFileBackend(self.data_dir)
+        self.index = CohortIndex(os.path.join(self.data_dir, "_cohort_index.json"), self._summary_row)
+        self._index_ready = False
+        self._index_lock = threading.Lock()
+        self._pending: Dict[str, tuple] = {}
+        self._pending_cond = threading.Condition()
+        self._generation = itertools.count(1)
+        self._written_generation: Dict[str, int] = {}
+        self._participant_locks: Dict[str, threading.Lock] = {}
+        self._flusher = None
+        atexit.register(self.index.persist, True)
+        # Registered last so it runs first at interpreter shutdown
+        atexit.register(self.flush)
+
+    def cohort_index(self) -> CohortIndex:
+        with self._index_lock:
+            if not self._index_ready:
+                started = time.time()
+                saved_at = self.index.load()
+                if saved_at is None:
+                    self.index.rebuild(self.get_summary_rows(), started)
+                else:
+                    # Pick up saves not yet reflected in the persisted rows
+                    for pid in self.backend.modified_since(saved_at - 1.0):
+                        data = self.load_participant(pid, read_only=True)
+                        if data:
+                            self.index.update(participant_summary(pid, data))
+                self._index_ready = True
+        return self.index
+
+    @property
+    def data_version(self) -> int:
+        # Bumped by every save once the index is live; keys memoized analytics
+        return self.index.version
+
+    def rebuild_index(self):
+        with self._index_lock:
+            started = time.time()
+            self.index.rebuild(self.get_summary_rows(), started)
+            self._index_ready = True
+
+    def _summary_row(self, participant_id: str) -> Optional[Dict]:
+        data = self._read_quietly(participant_id)
+        return participant_summary(participant_id, data) if data else None
+
+    def _update_index(self, participant_id: str, data: Dict):
+        # Before the first analytics view the index is reconciled on load instead
+        if self._index_ready:
+            self.index.update(participant_summary(participant_id, data))
+
+    def _participant_lock(self, participant_id: str) -> threading.Lock:
+        with self._pending_cond:
+            return self._participant_locks.setdefault(participant_id, threading.Lock())
+
+    def _write(self, participant_id: str, data: Dict, generation: int):
+        with self._participant_lock(participant_id):
+            # A newer document may already be on disk if a synchronous save overtook the flusher
+            if generation < self._written_generation.get(participant_id, 0):
+                return
+            self.backend.write_snapshot(participant_id, data)
+            self._written_generation[participant_id] = generation
+            # Coarse mtime resolution could otherwise hide our own write
+            self.cache.invalidate(participant_id)
+
+    def _discard_pending(self, participant_id: str, generation: int):
+        with self._pending_cond:
+            pending = self._pending.get(participant_id)
+            if pending and pending[0] <= generation:
+                del self._pending[participant_id]
 
     def save_participant(self, participant_id: str, data: Dict) -> bool:
         try:
-            file_path = os.path.join(self.data_dir, f"{participant_id}.json")
             data['last_updated'] = datetime.now().isoformat()
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            generation = next(self._generation)
+            self._write(participant_id, data, generation)
+            self._discard_pending(participant_id, generation)
+            self._update_index(participant_id, data)
             logger.info(f"Saved participant data for {participant_id}")
             return True
         except Exception as e:
@@ -229,14 +1048,100 @@ class RealTimeDatabase:
             st.error(f"Error saving data: {e}")
             return False
 
-    def load_participant(self, participant_id: str) -> Optional[Dict]:
+    def schedule_save(self, participant_id: str, data: Dict) -> bool:
+        data['last_updated'] = datetime.now().isoformat()
+        snapshot = copy.deepcopy(data)
+        with self._pending_cond:
+            self._pending[participant_id] = (next(self._generation), snapshot)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="participant-flusher", daemon=True)
+                self._flusher.start()
+            self._pending_cond.notify()
+        self._update_index(participant_id, snapshot)
+        return True
+
+    def _flush_loop(self):
+        while True:
+            with self._pending_cond:
+                while not self._pending:
+                    self._pending_cond.wait()
+            # Debounce: let rapid successive saves of the same participant coalesce
+            time.sleep(self.WRITE_BEHIND_DELAY)
+            self.flush()
+
+    def flush(self, participant_id: Optional[str] = None) -> bool:
+        with self._pending_cond:
+            if participant_id is None:
+                batch = dict(self._pending)
+            elif participant_id in self._pending:
+                batch = {participant_id: self._pending[participant_id]}
+            else:
+                batch = {}
+        ok = True
+        for pid, (generation, data) in batch.items():
+            try:
+                self._write(pid, data, generation)
+                # Entries stay pending until written so loads keep seeing them
+                self._discard_pending(pid, generation)
+            except Exception as e:
+                logger.error(f"Error flushing participant {pid}: {e}")
+                ok = False
+        if batch:
+            logger.info(f"Flushed {len(batch)} pending participant documents")
+        return ok
+
+    def append_attempt(self, participant_id: str, data: Dict, concept: str, is_correct: bool) -> bool:
+        try:
+            seq = data.get('journal_seq', 0) + 1
+            data['journal_seq'] = seq
+            record = {'s': seq, 'c': concept, 'ok': int(is_correct), 't': datetime.now().isoformat()}
+            with self._participant_lock(participant_id):
+                self.backend.append_journal(participant_id, record)
+                self.cache.invalidate(participant_id)
+            if seq % self.JOURNAL_COMPACT_EVERY == 0:
+                return self.schedule_save(participant_id, data)
+            self._update_index(participant_id, data)
+            return True
+        except Exception as e:
+            logger.error(f"Error journaling attempt for {participant_id}: {e}")
+            st.error(f"Error saving data: {e}")
+            return False
+
+    def _replay_journal(self, participant_id: str, data: Dict) -> Dict:
+        applied = data.get('journal_seq', 0)
+        for record in self.backend.read_journal(participant_id):
+            if record['s'] <= applied:
+                continue
+            apply_practice_attempt(data, record['c'], bool(record['ok']))
+            applied = record['s']
+        data['journal_seq'] = applied
+        return data
+
+    def _read_participant(self, participant_id: str) -> Optional[Dict]:
+        # Returns the shared cached document; callers must not mutate it
+        with self._pending_cond:
+            pending = self._pending.get(participant_id)
+            data = copy.deepcopy(pending[1]) if pending else None
+        if data is not None:
+            return self._replay_journal(participant_id, data)
+        token = self.backend.version_token(participant_id)
+        data = self.cache.get(participant_id, token)
+        if data is None:
+            data = self.backend.read_snapshot(participant_id)
+            if data:
+                data = self._replay_journal(participant_id, data)
+                self.cache.put(participant_id, token, data)
+        return data
+
+    def load_participant(self, participant_id: str, read_only: bool = False) -> Optional[Dict]:
+        # A cache hit still costs the version-token check (two stats on the JSON
+        # backend) plus a deep copy for sessions that mutate the document;
+        # read_only callers get the shared document and must not modify it
         try:
-            file_path = os.path.join(self.data_dir, f"{participant_id}.json")
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    logger.info(f"Loaded participant data for {participant_id}")
-                    return data
+            data = self._read_participant(participant_id)
+            if data:
+                logger.info(f"Loaded participant data for {participant_id}")
+                return data if read_only else copy.deepcopy(data)
             logger.warning(f"No data found for participant {participant_id}")
             return None
         except Exception as e:
@@ -244,26 +1149,500 @@ class RealTimeDatabase:
             st.error(f"Error loading data: {e}")
             return None
 
+    def _read_quietly(self, participant_id: str) -> Optional[Dict]:
+        try:
+            return self._read_participant(participant_id)
+        except Exception as e:
+            logger.error(f"Error loading participant {participant_id}: {e}")
+            return None
+
+    def _read_batch(self, participant_ids: List[str]) -> List[Tuple[str, Optional[Dict]]]:
+        return [(pid, self._read_quietly(pid)) for pid in participant_ids]
+
+    def iter_participants(self, parallel: bool = False, workers: int = 8, batch_size: int = 64) -> Iterator[Tuple[str, Dict]]:
+        # Yields read-only documents one at a time; unreadable ones are logged and skipped
+        ids = self.backend.list_ids()
+        if not parallel or len(ids) <= batch_size:
+            for pid in ids:
+                data = self._read_quietly(pid)
+                if data:
+                    yield pid, data
+            return
+        # Sliding window of in-flight batches keeps memory bounded while I/O overlaps
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="participant-loader") as executor:
+            in_flight = deque()
+            for start in range(0, len(ids), batch_size):
+                in_flight.append(executor.submit(self._read_batch, ids[start:start + batch_size]))
+                if len(in_flight) < workers * 2:
+                    continue
+                for pid, data in in_flight.popleft().result():
+                    if data:
+                        yield pid, data
+            while in_flight:
+                for pid, data in in_flight.popleft().result():
+                    if data:
+                        yield pid, data
+
     def get_all_participants(self) -> Dict[str, Dict]:
+        # Read-only view: documents are shared with the participant cache
         participants = {}
         try:
-            for filename in os.listdir(self.data_dir):
-                if filename.endswith('.json'):
-                    pid = filename.replace('.json', '')
-                    data = self.load_participant(pid)
-                    if data:
-                        participants[pid] = data
+            for pid, data in self.iter_participants(parallel=True):
+                participants[pid] = data
             logger.info(f"Retrieved {len(participants)} participants")
         except Exception as e:
             logger.error(f"Error retrieving participants: {e}")
             st.error(f"Error retrieving data: {e}")
         return participants
 
+    def allocate_participant_id(self) -> str:
+        return f"P{self.backend.allocate_id():03d}"
+
+    def count_participants(self) -> int:
+        try:
+            return self.backend.count()
+        except Exception as e:
+            logger.error(f"Error counting participants: {e}")
+            st.error(f"Error retrieving data: {e}")
+            return 0
+
+    def get_summary_rows(self) -> List[Dict]:
+        try:
+            rows = self.backend.summary_rows()
+            if rows is None:
+                rows = [participant_summary(pid, data) for pid, data in self.iter_participants(parallel=True)]
+            return rows
+        except Exception as e:
+            logger.error(f"Error retrieving participant summaries: {e}")
+            st.error(f"Error retrieving data: {e}")
+            return []
+
+@st.cache_resource
+def get_database() -> RealTimeDatabase:
+    return RealTimeDatabase()
+
+def migrate_json_to_sqlite(json_dir: str = "research_data", sqlite_path: Optional[str] = None) -> int:
+    sqlite_path = sqlite_path or os.path.join(json_dir, "easynatorics.sqlite3")
+    source = RealTimeDatabase(json_dir, backend="json")
+    target = SQLiteBackend(sqlite_path)
+    migrated = 0
+    for pid, data in source.iter_participants(parallel=True):
+        # Journal was replayed on read, so write the compacted document as-is
+        target.write_snapshot(pid, data)
+        migrated += 1
+    logger.info(f"Migrated {migrated} participants from {json_dir} to {sqlite_path}")
+    return migrated
+
 # ==================== AI INTEGRATION ====================
+class _JitteredRetry(Retry):
+    # Full jitter on top of urllib3's exponential backoff, so sessions that hit a
+    # 429 together do not all retry in the same instant
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    # One keep-alive pool per process: the TCP+TLS handshake is paid once, not per call
+    retry = _JitteredRetry(
+        total=3,
+        connect=3,
+        read=0,
+        status=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_background = threading.local()
+
+def _ui_warning(message: str):
+    # Worker threads have no Streamlit script context to show a warning in
+    if getattr(_background, 'active', False):
+        logger.warning(message)
+    else:
+        st.warning(message)
+
+class ResponseCache:
+    # On-disk LLM response cache shared by every process and replica that can
+    # see the file. Entries expire after a per-kind TTL; beyond max_bytes the
+    # least recently used entries are evicted.
+    TTL = {
+        'explanation': 7 * 24 * 3600,
+        'tutor': 7 * 24 * 3600,
+        'questions': 24 * 3600
+    }
+    # Bump when a prompt template changes so stale answers are not reused
+    PROMPT_VERSIONS = {'explanation': 1, 'tutor': 1, 'questions': 2}
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def make_key(self, model: str, kind: str, params: Dict) -> str:
+        raw = json.dumps([model, kind, self.PROMPT_VERSIONS.get(kind, 1), params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def contains(self, key: str, kind: str) -> bool:
+        # Freshness check without touching hit/miss counters or LRU order
+        row = self._conn().execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.TTL.get(kind, 24 * 3600)
+
+    def get(self, key: str, kind: str) -> Optional[Any]:
+        conn = self._conn()
+        row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.TTL.get(kind, 24 * 3600):
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, kind: str, value: Any):
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, payload, len(payload), now, now)
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+    def _evict(self, conn: sqlite3.Connection, excess: int):
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if freed >= excess:
+                break
+            victims.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        logger.info(f"Evicted {len(victims)} cached AI responses")
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(st.secrets.get("LLM_CACHE_PATH", os.path.join("llm_cache", "responses.sqlite3")))
+
+class LLMScheduler:
+    # Process-wide gate for outbound LLM calls: a token bucket caps the request
+    # rate, max_in_flight caps concurrency, and waiting calls are admitted in
+    # priority order (lower value first, FIFO within a class).
+    TUTOR = 0
+    INTERACTIVE = 1
+    PREFETCH = 2
+    PRIORITY_NAMES = {TUTOR: 'tutor', INTERACTIVE: 'interactive', PREFETCH: 'prefetch'}
+
+    def __init__(self, max_in_flight: int = 8, rate_per_sec: float = 5.0, burst: int = 10, max_wait: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.rate = rate_per_sec
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.admitted = {name: 0 for name in self.PRIORITY_NAMES.values()}
+        self.wait_seconds = {name: 0.0 for name in self.PRIORITY_NAMES.values()}
+        self.rejected = 0
+
+    def _refill_tokens(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self, priority: int):
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            while True:
+                now = time.monotonic()
+                self._refill_tokens(now)
+                if self._queue[0] == entry and self.in_flight < self.max_in_flight and self._tokens >= 1:
+                    break
+                if now >= deadline:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    raise requests.Timeout(f"LLM request waited more than {self.max_wait:g}s in queue")
+                # Sleep until a token is due (or a release/admission wakes us)
+                timeout = deadline - now
+                if self._tokens < 1:
+                    timeout = min(timeout, (1 - self._tokens) / self.rate)
+                self._cond.wait(timeout)
+            heapq.heappop(self._queue)
+            self._tokens -= 1
+            self.in_flight += 1
+            name = self.PRIORITY_NAMES.get(priority, str(priority))
+            self.admitted[name] = self.admitted.get(name, 0) + 1
+            self.wait_seconds[name] = self.wait_seconds.get(name, 0.0) + time.monotonic() - start
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self.max_queue_depth,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'admitted': dict(self.admitted),
+                'avg_wait_ms': {
+                    name: self.wait_seconds[name] / count * 1000 if count else 0.0
+                    for name, count in self.admitted.items()
+                }
+            }
+
+@st.cache_resource
+def get_llm_scheduler() -> LLMScheduler:
+    return LLMScheduler(
+        max_in_flight=int(st.secrets.get("LLM_MAX_IN_FLIGHT", 8)),
+        rate_per_sec=float(st.secrets.get("LLM_RATE_PER_SEC", 5)),
+        burst=int(st.secrets.get("LLM_BURST", 10))
+    )
+
+class _FlightAbandoned(Exception):
+    pass
+
+class SingleFlight:
+    # Concurrent callers for the same key share one in-flight computation
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, compute) -> Any:
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Future()
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+            if leader:
+                break
+            try:
+                return flight.result()
+            except _FlightAbandoned:
+                # The leader was interrupted (e.g. its session reran); compute for ourselves
+                continue
+        try:
+            result = compute()
+        except Exception as e:
+            # Ordinary failures are shared: followers would hit the same error
+            self._land(key, flight, exception=e)
+            raise
+        except BaseException:
+            # Control flow such as Streamlit's RerunException belongs to the
+            # leader's script thread only and must never surface in another session
+            self._land(key, flight, exception=_FlightAbandoned())
+            raise
+        self._land(key, flight, result=result)
+        return result
+
+    def _land(self, key: str, flight: Future, result: Any = None, exception: Optional[BaseException] = None):
+        # Free the key first so woken followers that retry start a new flight
+        with self._lock:
+            del self._flights[key]
+        if exception is None:
+            flight.set_result(result)
+        else:
+            flight.set_exception(exception)
+
+@st.cache_resource
+def get_single_flight() -> SingleFlight:
+    return SingleFlight()
+
+class TutorQuestionIndex:
+    # Offline near-duplicate lookup for tutor questions: character 4-gram
+    # shingles, MinHash signatures with LSH banding for candidates, then an
+    # exact Jaccard check against the threshold. Kept per context (concept)
+    # and per literal terms: numbers and one-letter symbols must match exactly,
+    # so "P(9,3)" is never answered with the cached answer for "P(8,3)".
+    NUM_PERM = 64
+    BANDS = 16
+    SHINGLE = 4
+    STOPWORDS = {
+        'apa', 'sih', 'dong', 'deh', 'ya', 'kak', 'itu', 'ini', 'yang', 'nya', 'tolong', 'jelaskan', 'gimana',
+        'bagaimana', 'dan', 'dengan', 'atau', 'harus', 'sama', 'ada', 'di', 'ke', 'dari', 'untuk', 'adalah',
+        'bisa', 'kalau', 'cara', 'soal'
+    }
+    # Informal and affixed forms students use for the same question word
+    SYNONYMS = {
+        'mengapa': 'kenapa', 'kok': 'kenapa', 'perbedaan': 'beda', 'membedakan': 'beda',
+        'menghitung': 'hitung', 'ngitung': 'hitung', 'dihitung': 'hitung', 'memakai': 'pakai',
+        'menggunakan': 'pakai', 'gunakan': 'pakai', 'dipakai': 'pakai', 'digunakan': 'pakai'
+    }
+    NUMBER_WORDS = {
+        'nol': '0', 'satu': '1', 'dua': '2', 'tiga': '3', 'empat': '4', 'lima': '5', 'enam': '6',
+        'tujuh': '7', 'delapan': '8', 'sembilan': '9', 'sepuluh': '10', 'sebelas': '11'
+    }
+    _PRIME = (1 << 31) - 1
+
+    def __init__(self, threshold: float = 0.7, seed: int = 7):
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self._PRIME, self.NUM_PERM, dtype=np.uint64)
+        self._b = rng.integers(0, self._PRIME, self.NUM_PERM, dtype=np.uint64)
+        self._entries: Dict[Tuple[str, Tuple[str, ...]], List[Dict]] = {}
+        self._buckets: Dict[Tuple[str, Tuple[str, ...]], Dict[Tuple[int, bytes], List[int]]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+
+    def _words(self, text: str) -> List[str]:
+        words = []
+        for word in re.sub(r'[^\w\s]', ' ', text.lower().replace('!', ' faktorial ')).split():
+            word = self.NUMBER_WORDS.get(word, word)
+            if len(word) > 5 and word.endswith(('nya', 'kah', 'lah')):
+                word = word[:-3]
+            words.append(self.SYNONYMS.get(word, word))
+        return words
+
+    @staticmethod
+    def _is_literal(word: str) -> bool:
+        return word.isdigit() or len(word) == 1
+
+    def literals(self, text: str) -> Tuple[str, ...]:
+        # Numbers and symbols in order of appearance; part of the lookup key
+        return tuple(w for w in self._words(text) if self._is_literal(w))
+
+    def normalize(self, text: str) -> str:
+        return " ".join(w for w in self._words(text) if not self._is_literal(w) and w not in self.STOPWORDS)
+
+    def _shingles(self, normalized: str) -> set:
+        padded = f" {normalized} "
+        if len(padded) <= self.SHINGLE:
+            return {zlib.crc32(padded.encode('utf-8'))}
+        return {zlib.crc32(padded[i:i + self.SHINGLE].encode('utf-8')) for i in range(len(padded) - self.SHINGLE + 1)}
+
+    def _signature(self, shingles: set) -> np.ndarray:
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles)) % np.uint64(self._PRIME)
+        hashes = (self._a[:, None] * x[None, :] + self._b[:, None]) % np.uint64(self._PRIME)
+        return hashes.min(axis=1)
+
+    def _bands(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        rows = self.NUM_PERM // self.BANDS
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.BANDS)]
+
+    def add(self, question: str, context: str, cache_key: str):
+        shingles = self._shingles(self.normalize(question))
+        signature = self._signature(shingles)
+        key = (context, self.literals(question))
+        with self._lock:
+            entries = self._entries.setdefault(key, [])
+            buckets = self._buckets.setdefault(key, {})
+            entries.append({'question': question, 'shingles': shingles, 'cache_key': cache_key})
+            for band in self._bands(signature):
+                buckets.setdefault(band, []).append(len(entries) - 1)
+
+    def lookup(self, question: str, context: str) -> Optional[Dict]:
+        start = time.perf_counter()
+        shingles = self._shingles(self.normalize(question))
+        signature = self._signature(shingles)
+        best, best_score = None, self.threshold
+        key = (context, self.literals(question))
+        with self._lock:
+            entries = self._entries.get(key, [])
+            buckets = self._buckets.get(key, {})
+            candidates = {i for band in self._bands(signature) for i in buckets.get(band, [])}
+            for i in candidates:
+                other = entries[i]['shingles']
+                score = len(shingles & other) / len(shingles | other)
+                if score >= best_score:
+                    best, best_score = entries[i], score
+            self.lookups += 1
+            self.hits += best is not None
+            self.lookup_seconds += time.perf_counter() - start
+        return best
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'avg_lookup_ms': self.lookup_seconds / self.lookups * 1000 if self.lookups else 0.0,
+                'entries': sum(len(e) for e in self._entries.values())
+            }
+
+@st.cache_resource
+def get_tutor_index() -> TutorQuestionIndex:
+    return TutorQuestionIndex(float(st.secrets.get("TUTOR_SIMILARITY_THRESHOLD", 0.7)))
+
 class DeepSeekAI:
+    # Seconds between placeholder refreshes while a tutor answer streams in
+    STREAM_RENDER_INTERVAL = 0.05
+    CONNECT_TIMEOUT = 3.05
+    READ_TIMEOUT = 20
+    # Non-streamed calls wait for the whole completion, so long ones get
+    # max_tokens / this many seconds when that exceeds READ_TIMEOUT
+    MIN_TOKENS_PER_SECOND = 40
+
     def __init__(self):
         self.api_key = st.secrets.get("DEEPSEEK_API_KEY", "")
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = st.secrets.get("DEEPSEEK_BASE_URL", "https://openrouter.ai/api/v1")
         self.model = "deepseek/deepseek-chat"
         self.demo_mode = not bool(self.api_key)
         if self.demo_mode:
@@ -271,75 +1650,275 @@ class DeepSeekAI:
         else:
             st.success("✅ Connected to DeepSeek AI")
 
-    def _call_api(self, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 800) -> Optional[str]:
-        if self.demo_mode:
-            return None
-        try:
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}",
-                "HTTP-Referer": "https://easynatorics.streamlit.app",
-                "X-Title": "EasyNatorics"
-            }
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
-            response = requests.post(
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://easynatorics.streamlit.app",
+            "X-Title": "EasyNatorics"
+        }
+
+    def _request(self, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 800,
+                 priority: int = LLMScheduler.INTERACTIVE) -> str:
+        # Raises requests exceptions and never touches the UI, so it is safe to
+        # run on behalf of other sessions (see _cached)
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        with get_llm_scheduler().slot(priority):
+            response = get_http_session().post(
                 f"{self.base_url}/chat/completions",
-                headers=headers,
+                headers=self._headers(),
                 json=payload,
-                timeout=10  # Timeout 10 detik
+                timeout=(self.CONNECT_TIMEOUT, max(self.READ_TIMEOUT, max_tokens / self.MIN_TOKENS_PER_SECOND))
             )
             response.raise_for_status()
             return response.json()["choices"][0]["message"]["content"]
-        except requests.Timeout:
+
+    @staticmethod
+    def _report_api_error(e: requests.RequestException):
+        if isinstance(e, requests.Timeout):
             logger.error("API request timed out")
-            st.warning("Connection to AI service timed out. Using fallback content.")
+            _ui_warning("Connection to AI service timed out. Using fallback content.")
+        else:
+            logger.error(f"API request failed: {e}")
+            _ui_warning(f"Failed to connect to AI service: {e}. Using fallback content.")
+
+    def _call_api(self, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 800,
+                  priority: int = LLMScheduler.INTERACTIVE) -> Optional[str]:
+        if self.demo_mode:
             return None
+        try:
+            return self._request(messages, temperature, max_tokens, priority)
         except requests.RequestException as e:
-            logger.error(f"API request failed: {e}")
-            st.warning(f"Failed to connect to AI service: {e}. Using fallback content.")
+            self._report_api_error(e)
+            return None
+
+    def _cached(self, kind: str, params: Dict, compute, fresh: bool = False) -> Optional[Any]:
+        # compute() may run for several sessions at once, so it raises instead of
+        # warning; each caller reports the failure in its own session. Failures
+        # return None and fallbacks are never cached.
+        cache = get_response_cache()
+        key = cache.make_key(self.model, kind, params)
+        if not fresh:
+            value = cache.get(key, kind)
+            if value is not None:
+                return value
+
+        def load():
+            # Re-check: a flight that just finished may have filled the cache
+            value = None if fresh else cache.get(key, kind)
+            if value is None:
+                value = compute()
+                if value is not None:
+                    cache.put(key, kind, value)
+            return value
+
+        try:
+            # Fresh requests want distinct output, so they are not coalesced
+            return load() if fresh else get_single_flight().do(key, load)
+        except requests.RequestException as e:
+            self._report_api_error(e)
             return None
 
-    @st.cache_data(show_spinner=False)
-    def get_explanation(_self, concept: str, level: str) -> str:
-        if _self.demo_mode:
-            return PRE_GENERATED_EXPLANATIONS.get(concept, {}).get(level, "Explanation not available")
+    def get_explanation(self, concept: str, level: str, priority: int = LLMScheduler.INTERACTIVE) -> str:
+        fallback = PRE_GENERATED_EXPLANATIONS.get(concept, {}).get(level, "Explanation not available")
+        if self.demo_mode:
+            return fallback
         prompt = f"""Jelaskan {concept} untuk siswa SMA level {level} dalam bahasa Indonesia.
         Format: judul, konsep inti, analogi sederhana, contoh, tips. Maksimal 400 kata."""
         messages = [
             {"role": "system", "content": "Anda tutor matematika yang sabar dan jelas."},
             {"role": "user", "content": prompt}
         ]
-        response = _self._call_api(messages, temperature=0.7, max_tokens=800)
-        return response if response else PRE_GENERATED_EXPLANATIONS.get(concept, {}).get(level, "Explanation not available")
-
-    @st.cache_data(show_spinner=False)
-    def ask_tutor(_self, question: str, context: str = "") -> str:
-        if _self.demo_mode:
-            return f"🤖 **AI Tutor:** In demo mode, full responses require an API key. Contoh jawaban: Coba gambarkan soal sebagai diagram pohon untuk memahami {context}."
+        response = self._cached(
+            'explanation', {'concept': concept, 'level': level},
+            lambda: self._request(messages, temperature=0.7, max_tokens=800, priority=priority)
+        )
+        return response if response else fallback
+
+    def _stream_api(self, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 800,
+                    priority: int = LLMScheduler.TUTOR) -> Iterator[str]:
+        # Chat-completions SSE stream; yields content deltas as they arrive
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        # The slot is held for the whole stream and released when the generator closes
+        with get_llm_scheduler().slot(priority), get_http_session().post(
+            f"{self.base_url}/chat/completions",
+            headers=self._headers(),
+            json=payload,
+            timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT),
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            # SSE is always UTF-8, whatever charset the Content-Type header omits
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; ':' lines are keep-alive comments
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed stream event: {data[:80]}")
+                    continue
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    def _tutor_messages(self, question: str, context: str) -> List[Dict]:
         prompt = f"""Konteks: {context}\nPertanyaan: {question}
         Berikan penjelasan mudah, analogi, contoh konkret, langkah sederhana.
         Format markdown dengan emoji. Maksimal 300 kata."""
-        messages = [
+        return [
             {"role": "system", "content": "Anda tutor matematika ramah dan jelas."},
             {"role": "user", "content": prompt}
         ]
-        response = _self._call_api(messages, temperature=0.7, max_tokens=600)
+
+    def _similar_tutor_answer(self, question: str, context: str) -> Optional[str]:
+        match = get_tutor_index().lookup(question, context)
+        if match is None:
+            return None
+        answer = get_response_cache().get(match['cache_key'], 'tutor')
+        if answer is None:
+            return None
+        logger.info(f"Tutor question answered from similar question: {match['question']!r}")
+        return f"_(Jawaban untuk pertanyaan serupa: \"{match['question']}\")_\n\n{answer}"
+
+    def ask_tutor(self, question: str, context: str = "") -> str:
+        if self.demo_mode:
+            return f"🤖 **AI Tutor:** In demo mode, full responses require an API key. Contoh jawaban: Coba gambarkan soal sebagai diagram pohon untuk memahami {context}."
+        key = get_response_cache().make_key(self.model, 'tutor', {'question': question, 'context': context})
+        response = get_response_cache().get(key, 'tutor') or self._similar_tutor_answer(question, context)
+        if response is None:
+            response = self._call_api(self._tutor_messages(question, context), temperature=0.7, max_tokens=600,
+                                     priority=LLMScheduler.TUTOR)
+            if response:
+                get_response_cache().put(key, 'tutor', response)
+                get_tutor_index().add(question, context, key)
         return f"🤖 **AI Tutor:**\n\n{response}" if response else f"🤖 **AI Tutor:** Tidak dapat menghubungi AI. Contoh: Untuk {context}, coba buat diagram pohon."
 
-    @st.cache_data(show_spinner=False)
-    def generate_questions(_self, concept: str, difficulty: str, count: int = 3) -> List[Dict]:
-        if _self.demo_mode:
-            return _self._demo_questions(concept, count)
-        prompt = f"""Buat {count} soal {concept} tingkat {difficulty} untuk SMA dalam bahasa Indonesia.
-        Format JSON:
+    def ask_tutor_stream(self, question: str, context: str = "") -> Iterator[str]:
+        if self.demo_mode:
+            yield self.ask_tutor(question, context)
+            return
+        cache = get_response_cache()
+        key = cache.make_key(self.model, 'tutor', {'question': question, 'context': context})
+        cached = cache.get(key, 'tutor') or self._similar_tutor_answer(question, context)
+        if cached is not None:
+            yield f"🤖 **AI Tutor:**\n\n{cached}"
+            return
+        parts = []
+        try:
+            for delta in self._stream_api(self._tutor_messages(question, context), temperature=0.7, max_tokens=600):
+                if not parts:
+                    yield "🤖 **AI Tutor:**\n\n"
+                parts.append(delta)
+                yield delta
+        except requests.RequestException as e:
+            logger.error(f"Streaming API request failed: {e}")
+            if not parts:
+                yield f"🤖 **AI Tutor:** Tidak dapat menghubungi AI. Contoh: Untuk {context}, coba buat diagram pohon."
+            return
+        if parts:
+            # Only complete answers are cached, so a dropped stream is retried next time
+            cache.put(key, 'tutor', "".join(parts))
+            get_tutor_index().add(question, context, key)
+        else:
+            yield f"🤖 **AI Tutor:** Tidak dapat menghubungi AI. Contoh: Untuk {context}, coba buat diagram pohon."
+
+    @staticmethod
+    def _valid_question(q: Any) -> bool:
+        if not isinstance(q, dict) or not isinstance(q.get('question'), str) or not q['question'].strip():
+            return False
+        options = q.get('options')
+        if not isinstance(options, list) or len(options) < 2 or len({str(o) for o in options}) != len(options):
+            return False
+        return str(q.get('answer')) in [str(o) for o in options]
+
+    @staticmethod
+    def _salvage_questions(text: str) -> List[Any]:
+        # Decode the "questions" array item by item so a truncated or broken
+        # tail only loses the items after the damage
+        start = text.find('"questions"')
+        start = text.find('[', start if start >= 0 else 0)
+        if start < 0:
+            return []
+        decoder = json.JSONDecoder()
+        items, pos = [], start + 1
+        while pos < len(text):
+            while pos < len(text) and text[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(text) or text[pos] == ']':
+                break
+            try:
+                item, pos = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                break
+            items.append(item)
+        return items
+
+    def _parse_questions(self, response: Optional[str]) -> Optional[List[Dict]]:
+        if not response:
+            return None
+        cleaned = response.strip()
+        if '```json' in cleaned:
+            cleaned = cleaned.split('```json')[1].split('```')[0].strip()
+        try:
+            result = json.loads(cleaned)
+            items = (result.get('questions') or []) if isinstance(result, dict) else []
+        except json.JSONDecodeError as e:
+            items = self._salvage_questions(cleaned)
+            logger.warning(f"Malformed questions JSON ({e}); salvaged {len(items)} items")
+        questions = []
+        for q in items:
+            if self._valid_question(q):
+                q['options'] = [str(o) for o in q['options']]
+                q['answer'] = str(q['answer'])
+                q.setdefault('explanation', '')
+                q.setdefault('hint', '')
+                questions.append(q)
+        if not questions:
+            logger.error("No valid questions in API response")
+            _ui_warning("Failed to generate questions. Using fallback questions.")
+            return None
+        return questions
+
+    def generate_question_batch(self, specs: List[Tuple[str, str, int]], fresh: bool = False,
+                                priority: int = LLMScheduler.PREFETCH) -> Dict[Tuple[str, str], List[Dict]]:
+        # One round trip for several (concept, difficulty, count) specs. Complete
+        # sets are cached under the keys cached_questions reads; any shortfall
+        # is filled by the local generator and not cached.
+        results: Dict[Tuple[str, str], List[Dict]] = {}
+        wanted = []
+        for concept, difficulty, count in specs:
+            cached = None if (fresh or self.demo_mode) else self.cached_questions(concept, difficulty, count)
+            if cached:
+                results[(concept, difficulty)] = cached
+            else:
+                wanted.append((concept, difficulty, count))
+        if wanted and not self.demo_mode:
+            lines = "\n".join(f"- concept={c}; level={d}; count={n}" for c, d, n in wanted)
+            prompt = f"""Buat soal kombinatorika untuk SMA dalam bahasa Indonesia sesuai daftar berikut:
+        {lines}
+        Format JSON, satu daftar datar; setiap soal menyertakan concept dan level persis seperti di daftar:
         {{
             "questions": [
                 {{
+                    "concept": "nama konsep",
+                    "level": "tingkat",
                     "question": "teks soal",
                     "options": ["A", "B", "C", "D"],
                     "answer": "jawaban benar",
@@ -349,101 +1928,431 @@ class DeepSeekAI:
             ]
         }}
         Soal kontekstual, menarik, dan jelas."""
-        messages = [
-            {"role": "system", "content": "Guru matematika kreatif. Kembalikan JSON valid."},
-            {"role": "user", "content": prompt}
-        ]
-        response = _self._call_api(messages, temperature=0.8, max_tokens=2000)
-        if response:
-            try:
-                cleaned = response.strip()
-                if '```json' in cleaned:
-                    cleaned = cleaned.split('```json')[1].split('```')[0].strip()
-                result = json.loads(cleaned)
-                return result.get('questions', [])
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON response: {e}")
-                st.warning("Failed to generate questions. Using fallback questions.")
-        return _self._demo_questions(concept, count)
-
-    def _demo_questions(self, concept: str, count: int) -> List[Dict]:
-        demo = {
-            "prinsip_perkalian": [
-                {
-                    "question": "Restoran punya 4 makanan, 3 minuman, 2 dessert. Berapa kombinasi menu?",
-                    "options": ["9", "12", "24", "36"],
-                    "answer": "24",
-                    "explanation": "4 × 3 × 2 = 24 kombinasi",
-                    "hint": "Kalikan semua pilihan"
-                },
-                {
-                    "question": "Ada 5 warna baju dan 3 ukuran. Berapa kombinasi baju?",
-                    "options": ["8", "15", "20", "25"],
-                    "answer": "15",
-                    "explanation": "5 × 3 = 15 kombinasi",
-                    "hint": "Hitung jumlah pilihan per kategori"
-                },
-                {
-                    "question": "Seorang siswa pilih 1 dari 4 buku dan 1 dari 3 waktu. Berapa kombinasi?",
-                    "options": ["7", "12", "16", "20"],
-                    "answer": "12",
-                    "explanation": "4 × 3 = 12 kombinasi",
-                    "hint": "Gunakan prinsip perkalian"
-                }
-            ],
-            "permutasi": [
-                {
-                    "question": "Dari 8 peserta, berapa susunan juara 1, 2, 3?",
-                    "options": ["56", "336", "512", "40320"],
-                    "answer": "336",
-                    "explanation": "P(8,3) = 8 × 7 × 6 = 336",
-                    "hint": "Urutan penting, pakai permutasi"
-                },
-                {
-                    "question": "Berapa cara susun 3 buku di rak?",
-                    "options": ["6", "9", "12", "18"],
-                    "answer": "6",
-                    "explanation": "3! = 3 × 2 × 1 = 6 cara",
-                    "hint": "Hitung faktorial"
-                },
-                {
-                    "question": "Pilih 2 dari 5 huruf untuk kode. Berapa susunan?",
-                    "options": ["10", "20", "25", "60"],
-                    "answer": "20",
-                    "explanation": "P(5,2) = 5 × 4 = 20 cara",
-                    "hint": "Urutan penting"
-                }
-            ],
-            "kombinasi": [
-                {
-                    "question": "Dari 10 orang, pilih 4 untuk panitia. Berapa cara?",
-                    "options": ["40", "210", "5040", "10000"],
-                    "answer": "210",
-                    "explanation": "C(10,4) = 10!/(4!×6!) = 210 cara",
-                    "hint": "Urutan tidak penting"
-                },
-                {
-                    "question": "Pilih 2 dari 5 topping pizza. Berapa cara?",
-                    "options": ["5", "10", "20", "25"],
-                    "answer": "10",
-                    "explanation": "C(5,2) = 5!/(2!×3!) = 10 cara",
-                    "hint": "Gunakan rumus kombinasi"
-                },
-                {
-                    "question": "Dari 7 warna, pilih 3 untuk logo. Berapa cara?",
-                    "options": ["21", "35", "49", "343"],
-                    "answer": "35",
-                    "explanation": "C(7,3) = 7!/(3!×4!) = 35 cara",
-                    "hint": "Pilih tanpa urutan"
-                }
+            messages = [
+                {"role": "system", "content": "Guru matematika kreatif. Kembalikan JSON valid."},
+                {"role": "user", "content": prompt}
             ]
-        }
-        return demo.get(concept, [])[:count]
+            total = sum(n for _, _, n in wanted)
+            questions = self._parse_questions(self._call_api(
+                messages, temperature=0.8, max_tokens=min(8000, 400 + 450 * total), priority=priority
+            )) or []
+            grouped: Dict[Tuple[str, str], List[Dict]] = {}
+            specs_by_tag = {(self._tag(c), self._tag(d)): (c, d) for c, d, _ in wanted}
+            dropped = 0
+            for q in questions:
+                tag = (self._tag(q.pop('concept', None)), self._tag(q.pop('level', None)))
+                spec = specs_by_tag.get(tag)
+                if spec is None and len(wanted) == 1:
+                    # Nothing to disambiguate: a missing or garbled tag still belongs to the only spec
+                    spec = (wanted[0][0], wanted[0][1])
+                if spec is None:
+                    dropped += 1
+                    continue
+                grouped.setdefault(spec, []).append(q)
+            if dropped:
+                logger.warning(f"Dropped {dropped}/{len(questions)} batch questions with unrecognized concept/level tags")
+            cache = get_response_cache()
+            for concept, difficulty, count in wanted:
+                got = grouped.get((concept, difficulty), [])[:count]
+                if len(got) == count:
+                    params = {'concept': concept, 'difficulty': difficulty, 'count': count}
+                    cache.put(cache.make_key(self.model, 'questions', params), 'questions', got)
+                elif got:
+                    logger.warning(f"Batch returned {len(got)}/{count} questions for {concept}/{difficulty}")
+                results[(concept, difficulty)] = got
+        for concept, difficulty, count in wanted:
+            got = results.get((concept, difficulty), [])
+            if len(got) < count:
+                results[(concept, difficulty)] = got + self._demo_questions(concept, difficulty, count - len(got))
+        return results
+
+    # Display names the model may echo back instead of the keys in the prompt
+    TAG_ALIASES = {
+        'perkalian': 'prinsip_perkalian', 'aturan_perkalian': 'prinsip_perkalian',
+        'pemula': 'beginner', 'dasar': 'beginner', 'menengah': 'intermediate',
+        'lanjut': 'advanced', 'lanjutan': 'advanced', 'mahir': 'advanced'
+    }
+
+    @classmethod
+    def _tag(cls, value: Any) -> Optional[str]:
+        if not isinstance(value, str):
+            return None
+        tag = re.sub(r'[\s\-]+', '_', value.strip().lower())
+        return cls.TAG_ALIASES.get(tag, tag)
+
+    def cached_questions(self, concept: str, difficulty: str, count: int) -> Optional[List[Dict]]:
+        # Cache-only lookup; never calls the API
+        cache = get_response_cache()
+        return cache.get(cache.make_key(self.model, 'questions', {'concept': concept, 'difficulty': difficulty, 'count': count}), 'questions')
+
+    def _demo_questions(self, concept: str, difficulty: str, count: int) -> List[Dict]:
+        return get_question_generator().generate(concept, difficulty, count)
+
+# ==================== QUESTION GENERATOR ====================
+class QuestionGenerator:
+    # Offline template questions with randomized context and parameters.
+    # Answers are computed exactly; distractors come from typical mistakes
+    # (adding instead of multiplying, counting order in a combination, ...).
+    MENU_CATEGORIES = [
+        ("Sebuah kafe", "menu", ["makanan utama", "minuman", "dessert", "camilan"]),
+        ("Rani", "gaya pakaian", ["baju", "celana", "sepatu", "topi"]),
+        ("Toko laptop", "paket laptop", ["prosesor", "ukuran RAM", "penyimpanan", "warna"]),
+        ("Kantin sekolah", "paket makan siang", ["nasi", "lauk", "sayur", "minuman"])
+    ]
+    ROUTE_PLACES = [("rumah", "sekolah", "perpustakaan", "taman"), ("Bandung", "Jakarta", "Bogor", "Depok"), ("asrama", "kampus", "laboratorium", "aula")]
+    RANK_EVENTS = ["lomba cerdas cermat", "lomba lari", "olimpiade matematika", "lomba pidato", "lomba desain poster"]
+    OFFICER_GROUPS = ["OSIS", "klub robotik", "kelompok ilmiah remaja", "tim basket", "paduan suara"]
+    OFFICER_ROLES = ["ketua", "wakil ketua", "sekretaris", "bendahara", "koordinator acara"]
+    ARRANGE_ITEMS = [("buku", "rak"), ("piala", "lemari kaca"), ("foto", "dinding"), ("pot bunga", "jendela")]
+    WORDS = ["MATEMATIKA", "KOMBINASI", "SEKOLAH", "BELAJAR", "PERMUTASI", "INDONESIA", "KALKULUS"]
+    CHOOSE_CONTEXTS = [
+        ("siswa", "dipilih menjadi panitia pensi"),
+        ("topping", "dipilih untuk sebuah pizza"),
+        ("soal", "dikerjakan dalam ujian pilihan"),
+        ("warna", "dipakai untuk logo kelas"),
+        ("buah", "dimasukkan ke dalam salad")
+    ]
+    TEAM_CONTEXTS = [("siswa laki-laki", "siswa perempuan", "tim debat"), ("guru", "siswa", "komite sekolah"), ("pemain senior", "pemain junior", "tim inti")]
+
+    def __init__(self, seed: Optional[int] = None):
+        self._random = random.Random(seed)
+
+    def _options(self, answer: int, mistakes: List[int]) -> List[str]:
+        rng = self._random
+        distractors = []
+        for value in mistakes:
+            if value > 0 and value != answer and value not in distractors:
+                distractors.append(value)
+        rng.shuffle(distractors)
+        distractors = distractors[:3]
+        spread = max(2, answer // 4)
+        while len(distractors) < 3:
+            value = answer + rng.randint(-spread, spread)
+            if value > 0 and value != answer and value not in distractors:
+                distractors.append(value)
+        options = [answer] + distractors
+        rng.shuffle(options)
+        return [str(v) for v in options]
+
+    def _question(self, text: str, answer: int, mistakes: List[int], explanation: str, hint: str) -> Dict:
+        options = self._options(answer, mistakes)
+        # Verified by construction, checked anyway so a bad template never reaches a student
+        if str(answer) not in options or len(set(options)) != 4:
+            raise ValueError(f"Invalid generated question: {text}")
+        return {"question": text, "options": options, "answer": str(answer), "explanation": explanation, "hint": hint}
+
+    def _perkalian(self, level: str) -> Dict:
+        rng = self._random
+        kind = rng.choice(['menu', 'route'] if level == 'beginner' else ['menu', 'route', 'code'])
+        if kind == 'menu':
+            owner, thing, categories = rng.choice(self.MENU_CATEGORIES)
+            size = {'beginner': 2, 'intermediate': 3}.get(level, 4)
+            counts = [rng.randint(2, 4 if level == 'beginner' else 7) for _ in range(size)]
+            parts = [f"{n} pilihan {c}" for n, c in zip(counts, categories)]
+            answer = math.prod(counts)
+            listed = ", ".join(parts[:-1]) + f" dan {parts[-1]}"
+            return self._question(
+                f"{owner} memiliki {listed}. Jika dipilih tepat satu dari setiap jenis, ada berapa {thing} berbeda?",
+                answer, [sum(counts), answer // counts[-1], answer + counts[0], max(counts) ** len(counts)],
+                f"{' × '.join(map(str, counts))} = {answer}", "Kalikan banyak pilihan tiap jenis"
+            )
+        if kind == 'route':
+            places = rng.choice(self.ROUTE_PLACES)
+            legs = 2 if level == 'beginner' else 3
+            counts = [rng.randint(2, 5 if level == 'beginner' else 6) for _ in range(legs)]
+            path = ", ".join(f"dari {places[i]} ke {places[i + 1]} ada {n} jalan" for i, n in enumerate(counts))
+            answer = math.prod(counts)
+            return self._question(
+                f"{path[0].upper()}{path[1:]}. Ada berapa rute berbeda dari {places[0]} ke {places[legs]} melalui semua tempat itu?",
+                answer, [sum(counts), answer * 2, answer - counts[0], counts[0] ** legs],
+                f"{' × '.join(map(str, counts))} = {answer} rute", "Setiap ruas perjalanan adalah satu tahap pilihan"
+            )
+        length = rng.randint(3, 4 if level == 'intermediate' else 5)
+        repeat = rng.random() < 0.5
+        answer = 10 ** length if repeat else math.perm(10, length)
+        rule = "boleh berulang" if repeat else "tidak boleh berulang"
+        return self._question(
+            f"Sebuah kode PIN terdiri dari {length} digit (0-9) dan digitnya {rule}. Ada berapa kode berbeda?",
+            answer, [math.perm(10, length) if repeat else 10 ** length, math.comb(10, length), 10 * length, 9 ** length],
+            f"{' × '.join(['10'] * length) if repeat else ' × '.join(str(10 - i) for i in range(length))} = {answer}",
+            "Tentukan banyak pilihan digit di setiap posisi"
+        )
+
+    def _permutasi(self, level: str) -> Dict:
+        rng = self._random
+        kind = rng.choice({'beginner': ['rank', 'arrange'], 'intermediate': ['rank', 'officers', 'arrange']}.get(level, ['officers', 'word', 'circle']))
+        if kind == 'rank':
+            n = rng.randint(5, 9 if level == 'beginner' else 15)
+            r = rng.randint(2, 3)
+            answer = math.perm(n, r)
+            return self._question(
+                f"Dari {n} peserta {rng.choice(self.RANK_EVENTS)}, ada berapa susunan juara 1 sampai juara {r}?",
+                answer, [math.comb(n, r), n ** r, n * r, math.perm(n, r - 1)],
+                f"P({n},{r}) = {' × '.join(str(n - i) for i in range(r))} = {answer}", "Urutan penting, gunakan permutasi"
+            )
+        if kind == 'arrange':
+            item, place = rng.choice(self.ARRANGE_ITEMS)
+            n = rng.randint(3, 5 if level == 'beginner' else 7)
+            answer = math.factorial(n)
+            return self._question(
+                f"Ada {n} {item} berbeda yang akan disusun berjajar di {place}. Ada berapa susunan berbeda?",
+                answer, [n * n, math.factorial(n - 1), n ** n, sum(range(1, n + 1))],
+                f"{n}! = {' × '.join(str(i) for i in range(n, 0, -1))} = {answer}", "Hitung faktorial dari banyak benda"
+            )
+        if kind == 'officers':
+            n = rng.randint(6, 12 if level == 'intermediate' else 20)
+            r = rng.randint(2, 3 if level == 'intermediate' else 4)
+            roles = ", ".join(self.OFFICER_ROLES[:r])
+            answer = math.perm(n, r)
+            return self._question(
+                f"Dari {n} anggota {rng.choice(self.OFFICER_GROUPS)} akan dipilih {roles} (tidak boleh rangkap jabatan). Ada berapa cara?",
+                answer, [math.comb(n, r), n ** r, math.perm(n, r) // 2, math.perm(n - 1, r)],
+                f"P({n},{r}) = {n}!/({n}-{r})! = {answer}", "Jabatan berbeda berarti urutan penting"
+            )
+        if kind == 'word':
+            word = rng.choice(self.WORDS)
+            counts = [word.count(c) for c in sorted(set(word))]
+            answer = math.factorial(len(word)) // math.prod(math.factorial(c) for c in counts)
+            repeated = " × ".join(f"{c}!" for c in counts if c > 1)
+            if repeated:
+                explanation = f"{len(word)}!/({repeated}) = {answer}"
+                hint = "Bagi dengan faktorial banyak huruf yang sama"
+            else:
+                explanation = f"{len(word)}! = {answer}"
+                hint = "Semua huruf berbeda, jadi susun seluruhnya"
+            return self._question(
+                f"Ada berapa susunan huruf berbeda yang dapat dibentuk dari semua huruf kata \"{word}\"?",
+                answer, [math.factorial(len(word)), answer * 2, math.factorial(len(set(word))), answer // 2],
+                explanation, hint
+            )
+        n = rng.randint(4, 9)
+        answer = math.factorial(n - 1)
+        return self._question(
+            f"{n} orang duduk mengelilingi meja bundar. Ada berapa susunan duduk berbeda?",
+            answer, [math.factorial(n), math.factorial(n - 1) // 2, n ** 2, math.factorial(n - 2)],
+            f"Permutasi siklis: ({n}-1)! = {answer}", "Satu orang dijadikan patokan posisi"
+        )
+
+    def _kombinasi(self, level: str) -> Dict:
+        rng = self._random
+        kind = 'choose' if level != 'advanced' else rng.choice(['team', 'at_least'])
+        if kind == 'choose':
+            thing, purpose = rng.choice(self.CHOOSE_CONTEXTS)
+            n = rng.randint(5, 8 if level == 'beginner' else 15)
+            r = rng.randint(2, 3 if level == 'beginner' else 5)
+            answer = math.comb(n, r)
+            return self._question(
+                f"Dari {n} {thing}, akan dipilih {r} untuk {purpose}. Ada berapa cara?",
+                answer, [math.perm(n, r), n * r, math.comb(n, r - 1), math.comb(n, r + 1)],
+                f"C({n},{r}) = {n}!/({r}!×{n - r}!) = {answer}", "Urutan tidak penting, gunakan kombinasi"
+            )
+        first, second, group = rng.choice(self.TEAM_CONTEXTS)
+        m, w = rng.randint(4, 9), rng.randint(4, 9)
+        if kind == 'team':
+            a, b = rng.randint(1, 3), rng.randint(1, 3)
+            answer = math.comb(m, a) * math.comb(w, b)
+            return self._question(
+                f"Dari {m} {first} dan {w} {second} akan dibentuk {group} berisi {a} {first} dan {b} {second}. Ada berapa cara?",
+                answer, [math.comb(m, a) + math.comb(w, b), math.comb(m + w, a + b), math.perm(m, a) * math.perm(w, b), math.comb(m, a)],
+                f"C({m},{a}) × C({w},{b}) = {math.comb(m, a)} × {math.comb(w, b)} = {answer}",
+                "Pilih tiap kelompok terpisah lalu kalikan"
+            )
+        r = rng.randint(3, 4)
+        answer = math.comb(m + w, r) - math.comb(w, r)
+        return self._question(
+            f"Dari {m} {first} dan {w} {second} akan dipilih {r} orang untuk {group}, paling sedikit 1 {first}. Ada berapa cara?",
+            answer, [math.comb(m + w, r), math.comb(m, 1) * math.comb(m + w - 1, r - 1), math.comb(m, r), math.comb(w, r)],
+            f"Semua cara − tanpa {first} = C({m + w},{r}) − C({w},{r}) = {answer}",
+            "Gunakan komplemen: total dikurangi kasus yang tidak memenuhi"
+        )
+
+    def generate(self, concept: str, level: str, count: int) -> List[Dict]:
+        make = {'prinsip_perkalian': self._perkalian, 'permutasi': self._permutasi, 'kombinasi': self._kombinasi}.get(concept)
+        if make is None:
+            return []
+        questions, seen = [], set()
+        for _ in range(count * 5):
+            if len(questions) >= count:
+                break
+            q = make(level)
+            if q['question'] not in seen:
+                seen.add(q['question'])
+                questions.append(q)
+        return questions
+
+@st.cache_resource
+def get_question_generator() -> QuestionGenerator:
+    return QuestionGenerator()
+
+# ==================== QUESTION BANK ====================
+def question_fingerprint(question: Dict) -> str:
+    text = " ".join(str(question.get('question', '')).lower().split())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+class QuestionBank:
+    # Ready-to-serve practice questions per (concept, level). Drawing is
+    # instant; a background worker tops a pool up whenever it falls below
+    # LOW_WATER, so students only wait when a pool is still cold.
+    LOW_WATER = 6
+    MAX_SIZE = 30
+    REFILL_COUNT = 3
+
+    def __init__(self, workers: int = 2):
+        self._pools: Dict[Tuple[str, str], List[Dict]] = {}
+        self._refilling = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="question-bank")
+
+    def _add(self, key: Tuple[str, str], questions: List[Dict]) -> int:
+        with self._lock:
+            pool = self._pools.setdefault(key, [])
+            present = {question_fingerprint(q) for q in pool}
+            added = 0
+            for q in questions:
+                fingerprint = question_fingerprint(q)
+                if fingerprint not in present and len(pool) < self.MAX_SIZE:
+                    pool.append(q)
+                    present.add(fingerprint)
+                    added += 1
+            return added
+
+    def _refill(self, ai: 'DeepSeekAI'):
+        # Claims every pool queued so far and tops them up with one batched
+        # API call per round instead of one call per pool
+        _background.active = True
+        with self._lock:
+            claimed, self._pending = self._pending, set()
+        keys = set(claimed)
+        try:
+            while keys:
+                batch = ai.generate_question_batch(
+                    [(concept, level, self.REFILL_COUNT) for concept, level in sorted(keys)], fresh=True
+                )
+                # Pools that got nothing new (e.g. demo content) stop instead of spinning
+                keys = {key for key, questions in batch.items() if self._add(key, questions) and self.size(*key) < self.LOW_WATER}
+        except Exception as e:
+            logger.error(f"Question bank refill failed for {sorted(claimed)}: {e}")
+        finally:
+            with self._lock:
+                self._refilling -= claimed
+
+    def request_refill(self, ai: 'DeepSeekAI', concept: str, level: str):
+        key = (concept, level)
+        with self._lock:
+            if key in self._refilling or len(self._pools.get(key, [])) >= self.LOW_WATER:
+                return
+            self._refilling.add(key)
+            self._pending.add(key)
+        self._executor.submit(self._refill, ai)
+
+    def size(self, concept: str, level: str) -> int:
+        with self._lock:
+            return len(self._pools.get((concept, level), []))
+
+    def draw(self, ai: 'DeepSeekAI', concept: str, level: str, count: int, seen: set) -> List[Dict]:
+        key = (concept, level)
+        with self._lock:
+            pool = self._pools.setdefault(key, [])
+            picked = [q for q in pool if question_fingerprint(q) not in seen][:count]
+            for q in picked:
+                pool.remove(q)
+        if len(picked) < count:
+            # Cold pool: prefer a cached AI set, otherwise generate locally so
+            # nobody waits on the network; unseen questions first
+            chosen = {question_fingerprint(q) for q in picked}
+            n = max(count, self.REFILL_COUNT)
+            candidates = ai.cached_questions(concept, level, n) or get_question_generator().generate(concept, level, n)
+            for prefer_unseen in (True, False):
+                for q in candidates:
+                    fingerprint = question_fingerprint(q)
+                    if len(picked) >= count or fingerprint in chosen or (prefer_unseen and fingerprint in seen):
+                        continue
+                    picked.append(q)
+                    chosen.add(fingerprint)
+        self.request_refill(ai, concept, level)
+        return picked
+
+@st.cache_resource
+def get_question_bank() -> QuestionBank:
+    return QuestionBank()
+
+# ==================== WARM-UP ====================
+WARMUP_LEVELS = ['beginner', 'intermediate', 'advanced']
+
+def warm_up_ai_cache(ai: 'DeepSeekAI', workers: int = 4, progress=None) -> Dict[str, Any]:
+    # Prefetch every explanation and the first question set per (concept, level)
+    # into the persistent response cache. Failed items keep serving the
+    # pre-generated fallback. progress(done, total, label, ok) is optional.
+    cache = get_response_cache()
+    count = QuestionBank.REFILL_COUNT
+    tasks = []
+    for concept in PRE_GENERATED_EXPLANATIONS:
+        for level in WARMUP_LEVELS:
+            tasks.append((
+                f"explanation {concept}/{level}", 'explanation',
+                [cache.make_key(ai.model, 'explanation', {'concept': concept, 'level': level})],
+                lambda c=concept, l=level: ai.get_explanation(c, l, priority=LLMScheduler.PREFETCH)
+            ))
+        # All levels of a concept share one batched request
+        tasks.append((
+            f"questions {concept}/{'+'.join(WARMUP_LEVELS)}", 'questions',
+            [cache.make_key(ai.model, 'questions', {'concept': concept, 'difficulty': level, 'count': count}) for level in WARMUP_LEVELS],
+            lambda c=concept: ai.generate_question_batch([(c, level, count) for level in WARMUP_LEVELS])
+        ))
+    summary = {'total': len(tasks), 'cached': 0, 'fallback': []}
+    if ai.demo_mode:
+        summary['fallback'] = [label for label, _, _, _ in tasks]
+        return summary
+
+    def run(task):
+        label, kind, keys, fetch = task
+        _background.active = True
+        try:
+            if not all(cache.contains(key, kind) for key in keys):
+                fetch()
+        except Exception as e:
+            logger.error(f"Warm-up failed for {label}: {e}")
+        return label, all(cache.contains(key, kind) for key in keys)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warmup") as executor:
+        for done, (label, ok) in enumerate(executor.map(run, tasks), 1):
+            if ok:
+                summary['cached'] += 1
+            else:
+                summary['fallback'].append(label)
+            if progress:
+                progress(done, len(tasks), label, ok)
+    logger.info(f"Warm-up cached {summary['cached']}/{summary['total']} AI responses")
+    return summary
+
+@st.cache_resource
+def start_background_warmup(_ai: 'DeepSeekAI') -> Future:
+    # Runs once per process; the leading underscore keeps the AI client out of the cache key
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup-main")
+    future = executor.submit(warm_up_ai_cache, _ai)
+    executor.shutdown(wait=False)
+    return future
 
 # ==================== RESEARCH SYSTEM ====================
+def apply_practice_attempt(data: Dict, concept: str, is_correct: bool):
+    data['learning_progress']['problems_attempted'] += 1
+    if is_correct:
+        data['learning_progress']['problems_correct'] += 1
+    perf = data['adaptive_learning']['performance_history'][concept]
+    perf['attempts'] += 1
+    if is_correct:
+        perf['correct'] += 1
+    if perf['attempts'] >= 3:
+        acc = perf['correct'] / perf['attempts']
+        if acc >= 0.8:
+            data['adaptive_learning']['current_levels'][concept] = 'advanced'
+        elif acc >= 0.6:
+            data['adaptive_learning']['current_levels'][concept] = 'intermediate'
+
 class ResearchSystem:
     def __init__(self):
-        self.db = RealTimeDatabase()
+        self.db = get_database()
         self._initialize_session_state()
 
     def _initialize_session_state(self):
@@ -481,13 +2390,13 @@ class ResearchSystem:
                     'kombinasi': {'attempts': 0, 'correct': 0}
                 }
             },
+            'journal_seq': 0,
             'registration_time': datetime.now().isoformat()
         }
 
     def register(self, demographics: Dict) -> Optional[str]:
         try:
-            all_p = self.db.get_all_participants()
-            pid = f"P{len(all_p) + 1:03d}"
+            pid = self.db.allocate_participant_id()
             new_data = self._create_template()
             new_data['participant_id'] = pid
             new_data['demographics'] = demographics
@@ -511,9 +2420,14 @@ class ResearchSystem:
             return True
         return False
 
-    def save_current(self) -> bool:
+    def save_current(self, critical: bool = False) -> bool:
         if st.session_state.current_participant:
-            return self.db.save_participant(
+            if critical:
+                return self.db.save_participant(
+                    st.session_state.current_participant,
+                    st.session_state.participant_data
+                )
+            return self.db.schedule_save(
                 st.session_state.current_participant,
                 st.session_state.participant_data
             )
@@ -522,26 +2436,30 @@ class ResearchSystem:
 
     def update_progress(self, concept: str, is_correct: bool) -> bool:
         data = st.session_state.participant_data
-        data['learning_progress']['problems_attempted'] += 1
-        if is_correct:
-            data['learning_progress']['problems_correct'] += 1
-        perf = data['adaptive_learning']['performance_history'][concept]
-        perf['attempts'] += 1
-        if is_correct:
-            perf['correct'] += 1
-        if perf['attempts'] >= 3:
-            acc = perf['correct'] / perf['attempts']
-            if acc >= 0.8:
-                data['adaptive_learning']['current_levels'][concept] = 'advanced'
-            elif acc >= 0.6:
-                data['adaptive_learning']['current_levels'][concept] = 'intermediate'
-        return self.save_current()
+        apply_practice_attempt(data, concept, is_correct)
+        if st.session_state.current_participant:
+            return self.db.append_attempt(st.session_state.current_participant, data, concept, is_correct)
+        logger.warning("No current participant to save")
+        return False
 
     def complete_module(self, module: str) -> bool:
         data = st.session_state.participant_data
         data['learning_progress']['module_progress'][module]['completed'] = True
         return self.save_current()
 
+    SEEN_QUESTIONS_LIMIT = 200
+
+    def seen_questions(self, concept: str) -> set:
+        seen = st.session_state.participant_data['adaptive_learning'].get('seen_questions', {})
+        return set(seen.get(concept, []))
+
+    def mark_questions_seen(self, concept: str, questions: List[Dict]):
+        adaptive = st.session_state.participant_data['adaptive_learning']
+        seen = adaptive.setdefault('seen_questions', {}).setdefault(concept, [])
+        seen.extend(question_fingerprint(q) for q in questions)
+        del seen[:-self.SEEN_QUESTIONS_LIMIT]
+        self.save_current()
+
     def get_level(self, concept: str) -> str:
         try:
             return st.session_state.participant_data['adaptive_learning']['current_levels'].get(concept, 'beginner')
@@ -785,6 +2703,269 @@ class Instruments:
             })
         return answers, score
 
+# ==================== COLUMNAR SNAPSHOT ====================
+SNAPSHOT_CONCEPTS = ['prinsip_perkalian', 'permutasi', 'kombinasi']
+
+def snapshot_schema(instruments: Instruments) -> Dict[str, str]:
+    # Column name -> 'num' (float64, NaN when missing) or 'str'
+    schema = {
+        'participant_id': 'str', 'nama': 'str', 'kelas': 'str', 'usia': 'num', 'pengalaman': 'str',
+        'registration_time': 'str', 'last_updated': 'str',
+        'pre_score': 'num', 'post_score': 'num',
+        'pre_completion_time': 'str', 'post_completion_time': 'str',
+        'pre_anxiety': 'num', 'post_anxiety': 'num',
+        'problems_attempted': 'num', 'problems_correct': 'num'
+    }
+    for i in range(1, len(instruments.amas_questions) + 1):
+        schema[f'amas_{i}'] = 'num'
+    for test, questions in [('pre', instruments.pre_test_questions), ('post', instruments.post_test_questions)]:
+        for q in questions:
+            schema[f"{test}_q{q['id']}_answer"] = 'str'
+            schema[f"{test}_q{q['id']}_correct"] = 'num'
+    for concept in SNAPSHOT_CONCEPTS:
+        schema[f'{concept}_attempts'] = 'num'
+        schema[f'{concept}_correct'] = 'num'
+        schema[f'{concept}_level'] = 'str'
+        schema[f'{concept}_completed'] = 'num'
+    return schema
+
+def _snapshot_number(value) -> float:
+    if isinstance(value, bool):
+        return float(value)
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+def flatten_participant(participant_id: str, data: Dict) -> Dict:
+    demographics = data.get('demographics', {})
+    progress = data.get('learning_progress', {})
+    adaptive = data.get('adaptive_learning', {})
+    row = {
+        'participant_id': participant_id,
+        'nama': demographics.get('nama'),
+        'kelas': demographics.get('kelas'),
+        'usia': demographics.get('usia'),
+        'pengalaman': demographics.get('pengalaman'),
+        'registration_time': data.get('registration_time'),
+        'last_updated': data.get('last_updated'),
+        'pre_score': data.get('pre_test', {}).get('score'),
+        'post_score': data.get('post_test', {}).get('score'),
+        'pre_completion_time': data.get('pre_test', {}).get('completion_time'),
+        'post_completion_time': data.get('post_test', {}).get('completion_time'),
+        'pre_anxiety': data.get('anxiety_survey', {}).get('pre_score'),
+        'post_anxiety': data.get('anxiety_survey', {}).get('post_score'),
+        'problems_attempted': progress.get('problems_attempted'),
+        'problems_correct': progress.get('problems_correct')
+    }
+    for i, response in enumerate(data.get('anxiety_survey', {}).get('responses', []), 1):
+        row[f'amas_{i}'] = response.get('response')
+    for test in ['pre', 'post']:
+        for answer in data.get(f'{test}_test', {}).get('answers', []):
+            row[f"{test}_q{answer['question_id']}_answer"] = answer.get('answer')
+            row[f"{test}_q{answer['question_id']}_correct"] = answer.get('correct')
+    for concept in SNAPSHOT_CONCEPTS:
+        perf = adaptive.get('performance_history', {}).get(concept, {})
+        row[f'{concept}_attempts'] = perf.get('attempts')
+        row[f'{concept}_correct'] = perf.get('correct')
+        row[f'{concept}_level'] = adaptive.get('current_levels', {}).get(concept)
+        row[f'{concept}_completed'] = progress.get('module_progress', {}).get(concept, {}).get('completed')
+    return row
+
+def load_columnar_snapshot(out_dir: str = os.path.join("research_data", "_snapshot"), mmap: bool = True) -> Dict[str, np.ndarray]:
+    with open(os.path.join(out_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return {
+        column: np.load(os.path.join(out_dir, f"{column}.npy"), mmap_mode='r' if mmap else None)
+        for column in manifest['columns']
+    }
+
+def export_columnar_snapshot(db: RealTimeDatabase, out_dir: Optional[str] = None) -> Dict[str, int]:
+    # One .npy file per column (np.load(..., mmap_mode='r') friendly) plus an
+    # Arrow IPC file when pyarrow is installed. Only participants whose version
+    # token changed since the previous export are re-read and re-flattened.
+    out_dir = out_dir or os.path.join(db.data_dir, "_snapshot")
+    os.makedirs(out_dir, exist_ok=True)
+    db.flush()
+    schema = snapshot_schema(Instruments())
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    previous, old_columns = {}, {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if list(manifest['columns']) == list(schema):
+            previous = manifest['tokens']
+            old_columns = load_columnar_snapshot(out_dir)
+    old_position = {pid: i for i, pid in enumerate(old_columns.get('participant_id', []))}
+
+    ids = sorted(db.backend.list_ids())
+    tokens, changed_rows, changed_pos, reused_new, reused_old = {}, [], [], [], []
+    for pos, pid in enumerate(ids):
+        tokens[pid] = json.dumps(db.backend.version_token(pid))
+        if previous.get(pid) == tokens[pid] and pid in old_position:
+            reused_new.append(pos)
+            reused_old.append(old_position[pid])
+            continue
+        data = db._read_quietly(pid)
+        if data:
+            changed_rows.append(flatten_participant(pid, data))
+            changed_pos.append(pos)
+        else:
+            tokens.pop(pid)
+    keep = np.array(sorted(reused_new + changed_pos), dtype=np.int64)
+    remap = np.full(len(ids), -1, dtype=np.int64)
+    remap[keep] = np.arange(len(keep))
+    reused_new, changed_pos = remap[reused_new], remap[changed_pos]
+    reused_old = np.array(reused_old, dtype=np.int64)
+
+    columns = {}
+    for column, kind in schema.items():
+        if kind == 'num':
+            fresh = np.array([_snapshot_number(r.get(column)) for r in changed_rows], dtype=np.float64)
+            values = np.full(len(keep), np.nan)
+        else:
+            fresh = np.array(['' if r.get(column) is None else str(r.get(column)) for r in changed_rows], dtype=str)
+            old_dtype = old_columns[column].dtype if column in old_columns else np.dtype('<U1')
+            values = np.zeros(len(keep), dtype=max(old_dtype, fresh.dtype if len(fresh) else old_dtype, key=lambda d: d.itemsize))
+        if len(reused_old):
+            values[reused_new] = old_columns[column][reused_old]
+        if len(fresh):
+            values[changed_pos] = fresh
+        columns[column] = values
+    old_columns = None  # release the memory maps before replacing their files
+
+    for column, values in columns.items():
+        tmp_path = os.path.join(out_dir, f"{column}.tmp.npy")
+        np.save(tmp_path, values)
+        os.replace(tmp_path, os.path.join(out_dir, f"{column}.npy"))
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        tmp_path = os.path.join(out_dir, "cohort.arrow.tmp")
+        feather.write_feather(pa.table(columns), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, os.path.join(out_dir, "cohort.arrow"))
+    except ImportError:
+        logger.info("pyarrow not installed; skipping Arrow snapshot")
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'columns': list(schema), 'tokens': tokens, 'exported_at': datetime.now().isoformat()}, f)
+    os.replace(tmp_path, manifest_path)
+    result = {'participants': len(keep), 'reflattened': len(changed_rows)}
+    logger.info(f"Exported columnar snapshot to {out_dir}: {result}")
+    return result
+
+# ==================== ITEM ANALYSIS ====================
+AMAS_SUBSCALES = ['Learning', 'Evaluation']
+
+def _column_corr(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    # Pearson r of matching columns; NaN where either column is constant
+    xc = x - x.mean(axis=0)
+    yc = y - y.mean(axis=0)
+    denom = np.sqrt((xc * xc).sum(axis=0) * (yc * yc).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denom > 0, (xc * yc).sum(axis=0) / denom, np.nan)
+
+def cronbach_alpha(matrix: np.ndarray) -> float:
+    # matrix: respondents x items, complete cases only
+    n, k = matrix.shape
+    if n < 2 or k < 2:
+        return float('nan')
+    total_var = matrix.sum(axis=1).var(ddof=1)
+    if total_var == 0:
+        return float('nan')
+    return float(k / (k - 1) * (1 - matrix.var(axis=0, ddof=1).sum() / total_var))
+
+def item_analysis_table(columns: Dict[str, np.ndarray], questions: List[Dict], test: str) -> pd.DataFrame:
+    # Difficulty index (share correct), corrected point-biserial (item vs. rest
+    # score) and the share choosing each option, over participants who
+    # answered every item of the test
+    correct = np.column_stack([np.asarray(columns[f"{test}_q{q['id']}_correct"], dtype=np.float64) for q in questions])
+    complete = ~np.isnan(correct).any(axis=1)
+    correct = correct[complete]
+    n = len(correct)
+    difficulty = correct.mean(axis=0) if n else np.full(len(questions), np.nan)
+    rest = correct.sum(axis=1, keepdims=True) - correct
+    discrimination = _column_corr(correct, rest) if n > 2 else np.full(len(questions), np.nan)
+    rows = []
+    for j, q in enumerate(questions):
+        answers = np.asarray(columns[f"{test}_q{q['id']}_answer"])[complete]
+        row = {
+            'Soal': q['id'],
+            'Konsep': q.get('concept', ''),
+            'N': n,
+            'Tingkat Kesukaran (p)': round(float(difficulty[j]), 3),
+            'Daya Beda (r_pb)': round(float(discrimination[j]), 3)
+        }
+        for letter, option in zip('ABCD', q['options']):
+            share = float((answers == option).mean()) if n else float('nan')
+            key = " ✓" if option == q['correct_answer'] else ""
+            row[f'Opsi {letter}'] = f"{option}{key}: {share:.0%}" if n else f"{option}{key}"
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def amas_reliability(columns: Dict[str, np.ndarray], amas_questions: List[Dict]) -> pd.DataFrame:
+    responses = np.column_stack([np.asarray(columns[f'amas_{i}'], dtype=np.float64) for i in range(1, len(amas_questions) + 1)])
+    responses = responses[~np.isnan(responses).any(axis=1)]
+    categories = np.array([item['cat'] for item in amas_questions])
+    rows = []
+    for name, mask in [(cat, categories == cat) for cat in AMAS_SUBSCALES] + [('Total', np.ones(len(categories), dtype=bool))]:
+        alpha = cronbach_alpha(responses[:, mask])
+        rows.append({'Subskala': name, 'Butir': int(mask.sum()), 'N': len(responses), "Cronbach's α": round(alpha, 3)})
+    return pd.DataFrame(rows)
+
+# ==================== RESAMPLING ====================
+# Upper bound on resamples x participants held in memory at once (~16 MB of int64 indices)
+RESAMPLE_CHUNK_ELEMENTS = 2_000_000
+
+def _resample_stats(diffs: np.ndarray, count: int, seed, chunk_elements: int = RESAMPLE_CHUNK_ELEMENTS) -> Tuple[np.ndarray, int]:
+    # Bootstrap means from index matrices and the number of sign-flip
+    # permutations whose |mean| reaches the observed one, chunk by chunk
+    rng = np.random.default_rng(seed)
+    n = len(diffs)
+    observed = abs(diffs.mean())
+    rows = max(1, chunk_elements // n)
+    means = np.empty(count)
+    extreme = 0
+    for start in range(0, count, rows):
+        size = min(rows, count - start)
+        index = rng.integers(0, n, size=(size, n))
+        means[start:start + size] = diffs[index].mean(axis=1)
+        signs = rng.integers(0, 2, size=(size, n), dtype=np.int8) * 2 - 1
+        # Small tolerance so ties with the observed statistic count as extreme
+        extreme += int((np.abs(signs @ diffs) / n >= observed - 1e-12).sum())
+    return means, extreme
+
+def paired_resampling(diffs: np.ndarray, resamples: int = 10000, confidence: float = 0.95,
+                      seed: int = 0, workers: int = 0) -> Optional[Dict[str, float]]:
+    # Percentile bootstrap CI for the mean difference, sign-flip permutation
+    # p-value and Cohen's dz. workers > 1 spreads the resamples over processes;
+    # if that fails (e.g. the caller cannot be pickled) it runs in-process.
+    diffs = np.asarray(diffs, dtype=np.float64)
+    n = len(diffs)
+    if n < 2:
+        return None
+    seeds = np.random.SeedSequence(seed).spawn(max(workers, 1))
+    counts = [resamples // len(seeds) + (i < resamples % len(seeds)) for i in range(len(seeds))]
+    parts = None
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(_resample_stats, [diffs] * workers, counts, seeds))
+        except Exception as e:
+            logger.warning(f"Process pool resampling failed, running in-process: {e}")
+    if parts is None:
+        parts = [_resample_stats(diffs, count, child) for count, child in zip(counts, seeds)]
+    means = np.concatenate([m for m, _ in parts])
+    extreme = sum(e for _, e in parts)
+    alpha = (1 - confidence) / 2
+    sd = diffs.std(ddof=1)
+    return {
+        'n': n,
+        'mean_diff': float(diffs.mean()),
+        'ci_low': float(np.quantile(means, alpha)),
+        'ci_high': float(np.quantile(means, 1 - alpha)),
+        'p_perm': (extreme + 1) / (resamples + 1),
+        'dz': float(diffs.mean() / sd) if sd > 0 else float('nan'),
+        'resamples': resamples
+    }
+
 # ==================== LEARNING MODULES ====================
 # ==================== LEARNING MODULES ====================
 class LearningModules:
@@ -833,9 +3014,17 @@ class LearningModules:
             key=f"tutor_{module_key}"
         )
         if question:
-            with st.spinner("AI sedang menjawab..."):
-                response = self.ai.ask_tutor(question, f"Konsep: {module['title']}")
-                st.markdown(f"<div class='card'>{response}</div>", unsafe_allow_html=True)
+            placeholder = st.empty()
+            placeholder.markdown("<div class='card'>🤖 AI sedang menjawab...</div>", unsafe_allow_html=True)
+            response = ""
+            last_render = 0.0
+            for chunk in self.ai.ask_tutor_stream(question, f"Konsep: {module['title']}"):
+                response += chunk
+                # Partial markdown is re-rendered at most every STREAM_RENDER_INTERVAL seconds
+                if time.time() - last_render >= self.ai.STREAM_RENDER_INTERVAL:
+                    placeholder.markdown(f"<div class='card'>{response}</div>", unsafe_allow_html=True)
+                    last_render = time.time()
+            placeholder.markdown(f"<div class='card'>{response}</div>", unsafe_allow_html=True)
 
         # Practice
         st.markdown("### 🎯 Latihan Adaptif")
@@ -843,7 +3032,9 @@ class LearningModules:
         # Initialize session state untuk soal jika belum ada
         if f'practice_questions_{module_key}' not in st.session_state:
             with st.spinner("Memuat soal adaptif..."):
-                questions = self.ai.generate_questions(module_key, level, 3)
+                seen = self.research.seen_questions(module_key)
+                questions = get_question_bank().draw(self.ai, module_key, level, 3, seen)
+                self.research.mark_questions_seen(module_key, questions)
                 st.session_state[f'practice_questions_{module_key}'] = questions
                 st.session_state[f'practice_answers_{module_key}'] = [None] * len(questions)
                 st.session_state[f'practice_checked_{module_key}'] = [False] * len(questions)
@@ -910,8 +3101,7 @@ class LearningModules:
         col1, col2, col3 = st.columns(3)
         with col1:
             if st.button("🎲 Soal Baru", key=f"refresh_{module_key}", use_container_width=True):
-                # Clear cache dan state untuk soal baru
-                st.cache_data.clear()
+                # Soal baru diambil dari bank soal, tanpa menghapus cache AI milik siswa lain
                 if f'practice_questions_{module_key}' in st.session_state:
                     del st.session_state[f'practice_questions_{module_key}']
                 if f'practice_answers_{module_key}' in st.session_state:
@@ -942,6 +3132,149 @@ class LearningModules:
                     st.session_state.current_module = None
                     st.rerun()
 # ==================== ANALYTICS ====================
+ANALYTICS_COLUMNS = {
+    'participant_id': 'ID',
+    'nama': 'Nama',
+    'kelas': 'Kelas',
+    'usia': 'Usia',
+    'pengalaman': 'Pengalaman',
+    'pre_anxiety': 'Skor Anxiety Pre',
+    'post_anxiety': 'Skor Anxiety Post',
+    'pre_score': 'Skor Pre-Test',
+    'post_score': 'Skor Post-Test',
+    'problems_attempted': 'Problems Attempted',
+    'problems_correct': 'Problems Correct',
+    'has_testimonial': 'Testimoni'
+}
+
+TABLE_DEFAULT_COLUMNS = ['ID', 'Nama', 'Kelas', 'Pengalaman', 'Skor Pre-Test', 'Skor Post-Test', 'Testimoni']
+TABLE_PAGE_SIZES = [25, 50, 100]
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def cohort_table(_index: CohortIndex, data_dir: str, version: int) -> pd.DataFrame:
+    # Shared read-only frame per data version; pages are sliced from it per viewer
+    with _index._lock:
+        rows = list(_index.rows.values())
+    df = pd.DataFrame.from_records(rows, columns=list(ANALYTICS_COLUMNS))
+    df = df.rename(columns=ANALYTICS_COLUMNS).sort_values('ID', kind='stable').reset_index(drop=True)
+    score_columns = ['Skor Anxiety Pre', 'Skor Anxiety Post', 'Skor Pre-Test', 'Skor Post-Test']
+    df[score_columns] = df[score_columns].apply(pd.to_numeric, errors='coerce').fillna(0)
+    df[['Skor Anxiety Pre', 'Skor Anxiety Post']] = df[['Skor Anxiety Pre', 'Skor Anxiety Post']].round(2)
+    df['Testimoni'] = df['Testimoni'].fillna(False).astype(bool)
+    return df
+
+def query_participants(table: pd.DataFrame, kelas: Optional[List[str]] = None, pengalaman: Optional[List[str]] = None,
+                       pre_range: Optional[Tuple[float, float]] = None, post_range: Optional[Tuple[float, float]] = None,
+                       sort_by: str = 'ID', descending: bool = False, columns: Optional[List[str]] = None,
+                       page: int = 1, page_size: int = 25) -> Tuple[pd.DataFrame, int]:
+    # Filter, sort and slice server-side; returns the requested page and the filtered row count
+    mask = np.ones(len(table), dtype=bool)
+    if kelas:
+        mask &= table['Kelas'].astype(str).isin(kelas).to_numpy()
+    if pengalaman:
+        mask &= table['Pengalaman'].astype(str).isin(pengalaman).to_numpy()
+    for column, bounds in [('Skor Pre-Test', pre_range), ('Skor Post-Test', post_range)]:
+        if bounds:
+            values = table[column].to_numpy()
+            mask &= (values >= bounds[0]) & (values <= bounds[1])
+    positions = np.flatnonzero(mask)
+    if sort_by != 'ID' or descending:
+        # The table has a RangeIndex, so sorted labels are positions; stable keeps ID order within ties
+        positions = table[sort_by].iloc[positions].sort_values(ascending=not descending, kind='stable').index.to_numpy()
+    start = (page - 1) * page_size
+    columns = ['ID'] + [c for c in (columns or TABLE_DEFAULT_COLUMNS) if c != 'ID']
+    return table.iloc[positions[start:start + page_size]][columns], len(positions)
+
+def render_participant_table(table: pd.DataFrame):
+    all_columns = list(ANALYTICS_COLUMNS.values())
+    with st.expander("🔎 Filter, Urutan & Kolom"):
+        col1, col2 = st.columns(2)
+        with col1:
+            kelas = st.multiselect("Kelas", sorted(table['Kelas'].astype(str).unique()), key="pt_kelas")
+            pre_range = st.slider("Skor Pre-Test", 0, 10, (0, 10), key="pt_pre")
+            sort_by = st.selectbox("Urutkan berdasarkan", all_columns, key="pt_sort")
+        with col2:
+            pengalaman = st.multiselect("Pengalaman", sorted(table['Pengalaman'].astype(str).unique()), key="pt_pengalaman")
+            post_range = st.slider("Skor Post-Test", 0, 10, (0, 10), key="pt_post")
+            descending = st.checkbox("Urutan menurun", key="pt_desc")
+        columns = st.multiselect("Kolom", all_columns, default=TABLE_DEFAULT_COLUMNS, key="pt_columns")
+    page_size = st.session_state.get("pt_page_size", TABLE_PAGE_SIZES[0])
+    filters = dict(kelas=kelas, pengalaman=pengalaman, pre_range=pre_range, post_range=post_range)
+    _, total = query_participants(table, **filters, page_size=0)
+    pages = max(1, math.ceil(total / page_size))
+    # Filters can shrink the result below the page a viewer was on
+    if st.session_state.get("pt_page", 1) > pages:
+        st.session_state.pt_page = pages
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        page = st.number_input("Halaman", min_value=1, max_value=pages, key="pt_page")
+    with col2:
+        st.selectbox("Baris per halaman", TABLE_PAGE_SIZES, key="pt_page_size")
+    page_df, total = query_participants(table, **filters, sort_by=sort_by, descending=descending,
+                                        columns=columns, page=int(page), page_size=page_size)
+    with col3:
+        first = (int(page) - 1) * page_size + 1 if total else 0
+        st.caption(f"Menampilkan {first}–{first + len(page_df) - 1 if total else 0} dari {total} partisipan")
+    st.dataframe(page_df, use_container_width=True, hide_index=True)
+    with_testimonial = table.loc[page_df.index, 'ID'][table.loc[page_df.index, 'Testimoni']].tolist()
+    if with_testimonial:
+        with st.expander("💬 Testimoni Partisipan"):
+            pid = st.selectbox("Pilih ID", with_testimonial, key="pt_testimonial")
+            if st.button("Tampilkan Testimoni", key="pt_show_testimonial"):
+                # Only the selected document is read; testimonials are not kept in the index
+                data = research.db.load_participant(pid, read_only=True)
+                st.markdown(f"> {data.get('satisfaction_survey', {}).get('testimonial', '') if data else ''}")
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def cohort_analytics(_index: CohortIndex, data_dir: str, paired_version: int) -> Dict[str, Optional[pd.DataFrame]]:
+    # Keyed on the paired-data version: reruns, concurrent viewers and practice
+    # answers reuse one result (and its resampling) until a pre/post value changes
+    results = {'anxiety': None, 'score': None}
+    workers = int(st.secrets.get("RESAMPLING_WORKERS", 0))
+    resampled_metrics = ['CI 95% (bootstrap)', 'p-value (permutasi)', "Cohen's dz"]
+
+    def resampled_values(diffs: np.ndarray) -> List:
+        boot = paired_resampling(diffs, workers=workers)
+        return [f"[{boot['ci_low']:.2f}, {boot['ci_high']:.2f}]",
+                '<0.001' if boot['p_perm'] < 0.001 else round(boot['p_perm'], 4), round(boot['dz'], 2)]
+
+    anx = _index.paired_stats('anxiety')
+    if anx:
+        results['anxiety'] = pd.DataFrame({
+            'Metric': ['Mean Pre', 'Mean Post', 'Penurunan', 't-value', 'p-value'] + resampled_metrics,
+            'Value': [round(anx['mean_pre'], 2), round(anx['mean_post'], 2), round(anx['mean_diff'], 2),
+                     round(anx['t'], 2), '<0.001' if anx['p'] < 0.001 else round(anx['p'], 4)]
+                     + resampled_values(_index.paired_differences('anxiety'))
+        })
+    score = _index.paired_stats('score')
+    if score:
+        # Gain is post - pre, the opposite sign of the stored difference
+        results['score'] = pd.DataFrame({
+            'Metric': ['Mean Pre', 'Mean Post', 'Peningkatan', 't-value', 'p-value'] + resampled_metrics,
+            'Value': [round(score['mean_pre'], 1), round(score['mean_post'], 1), round(-score['mean_diff'], 2),
+                     round(score['t'], 2), '<0.001' if score['p'] < 0.001 else round(score['p'], 4)]
+                     + resampled_values(-_index.paired_differences('score'))
+        })
+    for name in ('anxiety', 'score'):
+        # Mixed numbers and '<0.001'-style strings do not serialize to Arrow
+        if results[name] is not None:
+            results[name]['Value'] = results[name]['Value'].astype(str)
+    return results
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def cohort_item_analysis(_db: RealTimeDatabase, data_dir: str, paired_version: int) -> Dict[str, pd.DataFrame]:
+    # Test answers and AMAS responses are saved together with the pre/post
+    # scores, so the paired version only moves on test or survey input, not on
+    # practice answers. The export is incremental: only changed participants are re-read.
+    export_columnar_snapshot(_db)
+    columns = load_columnar_snapshot(os.path.join(data_dir, "_snapshot"), mmap=False)
+    instruments = Instruments()
+    return {
+        'pre': item_analysis_table(columns, instruments.pre_test_questions, 'pre'),
+        'post': item_analysis_table(columns, instruments.post_test_questions, 'post'),
+        'amas': amas_reliability(columns, instruments.amas_questions)
+    }
+
 def render_analytics():
     st.markdown("<div class='card'><h1>📈 Analisis Data</h1></div>", unsafe_allow_html=True)
     data = st.session_state.participant_data
@@ -991,63 +3324,28 @@ def render_analytics():
         </div>
         """, unsafe_allow_html=True)
     st.markdown("### 🌍 Data Global Partisipan")
-    all_participants = research.db.get_all_participants()
-    if all_participants:
-        df_data = []
-        pre_anx_list, post_anx_list, pre_test_list, post_test_list = [], [], [], []
-        for pid, pdata in all_participants.items():
-            pre_anx = pdata.get('anxiety_survey', {}).get('pre_score', 0) or 0
-            post_anx = pdata.get('anxiety_survey', {}).get('post_score', 0) or 0
-            pre_score = pdata.get('pre_test', {}).get('score', 0) or 0
-            post_score = pdata.get('post_test', {}).get('score', 0) or 0
-            if isinstance(pre_anx, (int, float)):
-                pre_anx_list.append(pre_anx)
-            if isinstance(post_anx, (int, float)):
-                post_anx_list.append(post_anx)
-            if isinstance(pre_score, (int, float)):
-                pre_test_list.append(pre_score)
-            if isinstance(post_score, (int, float)):
-                post_test_list.append(post_score)
-            df_data.append({
-                'ID': pid,
-                'Nama': pdata.get('demographics', {}).get('nama', 'Unknown'),
-                'Kelas': pdata.get('demographics', {}).get('kelas', 'Unknown'),
-                'Usia': pdata.get('demographics', {}).get('usia', 0),
-                'Pengalaman': pdata.get('demographics', {}).get('pengalaman', 'Unknown'),
-                'Skor Anxiety Pre': round(pre_anx, 2),
-                'Skor Anxiety Post': round(post_anx, 2),
-                'Skor Pre-Test': pre_score,
-                'Skor Post-Test': post_score,
-                'Problems Attempted': pdata.get('learning_progress', {}).get('problems_attempted', 0),
-                'Problems Correct': pdata.get('learning_progress', {}).get('problems_correct', 0),
-                'Testimonial': pdata.get('satisfaction_survey', {}).get('testimonial', '')
-            })
-        df = pd.DataFrame(df_data)
-        st.dataframe(df, use_container_width=True)
-        if len(pre_anx_list) > 1 and len(post_anx_list) > 1:
-            mean_pre_anx = np.mean(pre_anx_list)
-            mean_post_anx = np.mean(post_anx_list)
-            decrease = mean_pre_anx - mean_post_anx
-            t_anx, p_anx = stats.ttest_rel(pre_anx_list, post_anx_list)
+    index = research.db.cohort_index()
+    if st.button("🔄 Hitung Ulang Statistik", key="rebuild_cohort_index"):
+        with st.spinner("Menghitung ulang dari seluruh data partisipan..."):
+            research.db.rebuild_index()
+    if index.rows:
+        render_participant_table(cohort_table(index, research.db.data_dir, research.db.data_version))
+        results = cohort_analytics(index, research.db.data_dir, index.paired_version)
+        if results['anxiety'] is not None:
             st.markdown("### Table 1: Perbandingan Skor Kecemasan Matematika")
-            summary_anx = pd.DataFrame({
-                'Metric': ['Mean Pre', 'Mean Post', 'Penurunan', 't-value', 'p-value'],
-                'Value': [round(mean_pre_anx, 2), round(mean_post_anx, 2), round(decrease, 2), 
-                         round(t_anx, 2), '<0.001' if p_anx < 0.001 else round(p_anx, 4)]
-            })
-            st.table(summary_anx)
-        if len(pre_test_list) > 1 and len(post_test_list) > 1:
-            mean_pre_test = np.mean(pre_test_list)
-            mean_post_test = np.mean(post_test_list)
-            increase = mean_post_test - mean_pre_test
-            t_test, p_test = stats.ttest_rel(pre_test_list, post_test_list)
+            st.table(results['anxiety'])
+        if results['score'] is not None:
             st.markdown("### Table 2: Perbandingan Nilai Pre-test dan Post-test")
-            summary_test = pd.DataFrame({
-                'Metric': ['Mean Pre', 'Mean Post', 'Peningkatan', 't-value', 'p-value'],
-                'Value': [round(mean_pre_test, 1), round(mean_post_test, 1), round(increase, 2), 
-                         round(t_test, 2), '<0.001' if p_test < 0.001 else round(p_test, 4)]
-            })
-            st.table(summary_test)
+            st.table(results['score'])
+        if st.checkbox("🔬 Tampilkan Analisis Butir Soal", key="show_item_analysis"):
+            with st.spinner("Menganalisis butir soal..."):
+                items = cohort_item_analysis(research.db, research.db.data_dir, index.paired_version)
+            st.markdown("### Table 3: Analisis Butir Pre-Test")
+            st.dataframe(items['pre'], use_container_width=True, hide_index=True)
+            st.markdown("### Table 4: Analisis Butir Post-Test")
+            st.dataframe(items['post'], use_container_width=True, hide_index=True)
+            st.markdown("### Table 5: Reliabilitas AMAS (Survey Awal)")
+            st.table(items['amas'])
 
 # ==================== MAIN APP ====================
 def main():
@@ -1055,6 +3353,8 @@ def main():
     global research, ai, instruments, modules
     research = ResearchSystem()
     ai = DeepSeekAI()
+    if not ai.demo_mode and st.secrets.get("WARMUP_ON_STARTUP", False):
+        start_background_warmup(ai)
     instruments = Instruments()
     modules = LearningModules(ai, research)
     if 'current_page' not in st.session_state:
@@ -1074,6 +3374,7 @@ def main():
             index=pages.index(st.session_state.current_page) if st.session_state.current_page in pages else 0
         )
         if st.session_state.current_participant and st.button("🚪 Logout", use_container_width=True):
+            research.db.flush(st.session_state.current_participant)
             st.session_state.current_participant = None
             st.session_state.participant_data = research._create_template()
             st.session_state.current_page = "Dashboard"
@@ -1138,7 +3439,7 @@ def main():
                 amas_score = np.mean([r['response'] for r in responses])
                 st.session_state.participant_data['anxiety_survey']['pre_score'] = amas_score
                 st.session_state.participant_data['anxiety_survey']['responses'] = responses
-                research.save_current()
+                research.save_current(critical=True)
                 anxiety_level = "Rendah" if amas_score <= 2.0 else "Sedang" if amas_score <= 3.5 else "Tinggi"
                 st.success(f"""
                 ✅ Survey berhasil disimpan!
@@ -1160,7 +3461,7 @@ def main():
                 st.session_state.participant_data['pre_test']['answers'] = answers
                 st.session_state.participant_data['pre_test']['score'] = score
                 st.session_state.participant_data['pre_test']['completion_time'] = datetime.now().isoformat()
-                research.save_current()
+                research.save_current(critical=True)
                 st.markdown(f"""
                 <div class='card' style='background: linear-gradient(135deg, {COLORS['primary']}, {COLORS['accent1']}); color: white;'>
                     <h2>📊 Hasil Pre-Test</h2>
@@ -1220,7 +3521,7 @@ def main():
                 st.session_state.participant_data['post_test']['answers'] = answers
                 st.session_state.participant_data['post_test']['score'] = score
                 st.session_state.participant_data['post_test']['completion_time'] = datetime.now().isoformat()
-                research.save_current()
+                research.save_current(critical=True)
                 pre_score = st.session_state.participant_data['pre_test'].get('score', 0) or 0
                 improvement = score - pre_score
                 st.markdown(f"""
@@ -1253,7 +3554,7 @@ def main():
                 post_amas = np.mean([r['response'] for r in post_responses])
                 st.session_state.participant_data['anxiety_survey']['post_score'] = post_amas
                 st.session_state.participant_data['satisfaction_survey']['testimonial'] = testimonial.strip()
-                research.save_current()
+                research.save_current(critical=True)
                 st.success("✅ Semua data berhasil disimpan! Terima kasih atas partisipasi Anda!")
                 time.sleep(2)
                 st.session_state.current_page = "Hasil"
@@ -1267,4 +3568,21 @@ def main():
         render_analytics()
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-sqlite":
+        # python EN28.py migrate-sqlite [json_dir] [sqlite_path]
+        count = migrate_json_to_sqlite(*sys.argv[2:4])
+        print(f"Migrated {count} participants")
+    elif len(sys.argv) > 1 and sys.argv[1] == "export-snapshot":
+        # python EN28.py export-snapshot [data_dir] [out_dir] [json|sqlite]
+        db = RealTimeDatabase(sys.argv[2] if len(sys.argv) > 2 else "research_data",
+                              backend=sys.argv[4] if len(sys.argv) > 4 else "json")
+        print(export_columnar_snapshot(db, sys.argv[3] if len(sys.argv) > 3 else None))
+    elif len(sys.argv) > 1 and sys.argv[1] == "warmup":
+        # python EN28.py warmup [workers]
+        summary = warm_up_ai_cache(
+            DeepSeekAI(), int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+            lambda done, total, label, ok: print(f"[{done}/{total}] {label}: {'ok' if ok else 'fallback'}")
+        )
+        print(f"Cached {summary['cached']}/{summary['total']}; fallback for {len(summary['fallback'])}")
+    else:
+        main()
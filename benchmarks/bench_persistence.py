@@ -0,0 +1,213 @@
+"""Benchmarks for the RealTimeDatabase / ResearchSystem persistence paths.
+
+Runs without a Streamlit server: a minimal stand-in for the ``streamlit``
+module is installed before EN28 is imported.
+
+    python benchmarks/bench_persistence.py --sizes 10,1000,10000,100000 --backends json,sqlite
+    python benchmarks/bench_persistence.py --sizes 10,1000 --output bench_results.json
+
+Results are written as JSON (one record per backend/size/operation with
+throughput and p50/p99 latency) so runs can be diffed against each other.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _SessionState(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+def _passthrough_decorator(func=None, **kwargs):
+    if func is None:
+        return lambda f: f
+    return func
+
+
+def install_streamlit_stub():
+    stub = types.ModuleType("streamlit")
+    for name in ["set_page_config", "markdown", "info", "success", "warning", "error", "table", "dataframe"]:
+        setattr(stub, name, lambda *args, **kwargs: None)
+    stub.secrets = {}
+    stub.session_state = _SessionState()
+    stub.cache_data = _passthrough_decorator
+    stub.cache_data.clear = lambda: None
+    stub.cache_resource = _passthrough_decorator
+    sys.modules["streamlit"] = stub
+    return stub
+
+
+st = install_streamlit_stub()
+sys.path.insert(0, ROOT)
+import EN28  # noqa: E402
+
+
+def synthetic_participant(pid: str, instruments: "EN28.Instruments", rng: random.Random) -> dict:
+    data = EN28.ResearchSystem._create_template(None)
+    data['participant_id'] = pid
+    data['demographics'] = {
+        'nama': f"Siswa {pid}",
+        'kelas': rng.choice(["10", "11", "12"]),
+        'usia': rng.randint(15, 18),
+        'pengalaman': rng.choice(["Pemula", "Menengah", "Lanjutan"])
+    }
+    for test, questions in [('pre_test', instruments.pre_test_questions), ('post_test', instruments.post_test_questions)]:
+        answers = []
+        for q in questions:
+            answer = rng.choice(q['options'])
+            answers.append({'question_id': q['id'], 'answer': answer, 'correct': answer == q['correct_answer']})
+        data[test]['answers'] = answers
+        data[test]['score'] = sum(a['correct'] for a in answers)
+        data[test]['completion_time'] = datetime.now().isoformat()
+    responses = [{'question': item['q'], 'response': rng.randint(1, 5)} for item in instruments.amas_questions]
+    data['anxiety_survey'] = {
+        'pre_score': float(np.mean([r['response'] for r in responses])),
+        'post_score': round(rng.uniform(1, 5), 2),
+        'responses': responses
+    }
+    for concept in EN28.SNAPSHOT_CONCEPTS:
+        for _ in range(rng.randint(0, 6)):
+            EN28.apply_practice_attempt(data, concept, rng.random() < 0.6)
+    data['satisfaction_survey']['testimonial'] = "Belajar kombinatorika jadi seru. " * rng.randint(0, 4)
+    return data
+
+
+def populate(db: "EN28.RealTimeDatabase", size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    instruments = EN28.Instruments()
+    ids = []
+    for _ in range(size):
+        pid = db.allocate_participant_id()
+        data = synthetic_participant(pid, instruments, rng)
+        data['last_updated'] = datetime.now().isoformat()
+        db.backend.write_snapshot(pid, data)
+        ids.append(pid)
+    return ids
+
+
+def measure(operation, samples: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for i in range(samples):
+        t0 = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'samples': samples,
+        'throughput_ops_s': samples / elapsed if elapsed > 0 else None,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_ms': float(latencies_ms.mean())
+    }
+
+
+def bench_cohort(backend: str, size: int, args) -> list:
+    data_dir = tempfile.mkdtemp(prefix=f"easynatorics-bench-{backend}-{size}-")
+    results = []
+    try:
+        db = EN28.RealTimeDatabase(data_dir, backend=backend)
+        t0 = time.perf_counter()
+        ids = populate(db, size, args.seed)
+        print(f"[{backend} n={size}] populated in {time.perf_counter() - t0:.1f}s", flush=True)
+        rng = random.Random(args.seed + 1)
+        samples = min(args.samples, size)
+        docs = {pid: db.load_participant(pid) for pid in rng.sample(ids, samples)}
+        sample_ids = list(docs)
+
+        def record(operation, stats):
+            stats.update({'backend': backend, 'size': size, 'operation': operation})
+            results.append(stats)
+            print(f"[{backend} n={size}] {operation:<28} {stats['throughput_ops_s'] or 0:>10.1f} ops/s"
+                  f"  p50 {stats['p50_ms']:.3f} ms  p99 {stats['p99_ms']:.3f} ms", flush=True)
+
+        record('save_participant', measure(lambda i: db.save_participant(sample_ids[i], docs[sample_ids[i]]), samples))
+        # Saving invalidated the cached copies; load each sample once so the timed pass only hits
+        for pid in sample_ids:
+            db.load_participant(pid)
+        hits, misses = db.cache.hits, db.cache.misses
+        record('load_participant_cached', measure(lambda i: db.load_participant(sample_ids[i]), samples))
+        results[-1].update({'cache_hits': db.cache.hits - hits, 'cache_misses': db.cache.misses - misses})
+        record('load_participant_read_only',
+               measure(lambda i: db.load_participant(sample_ids[i], read_only=True), samples))
+        uncached = EN28.RealTimeDatabase(data_dir, backend=backend, cache_entries=0)
+        record('load_participant_uncached', measure(lambda i: uncached.load_participant(sample_ids[i]), samples))
+        if size <= args.get_all_limit:
+            repeats = args.bulk_repeats
+            record('get_all_participants', measure(lambda i: db.get_all_participants(), repeats))
+        record('iter_participants_parallel',
+               measure(lambda i: sum(1 for _ in db.iter_participants(parallel=True)), args.bulk_repeats))
+
+        # ResearchSystem paths go through the stubbed session state
+        EN28.get_database = lambda: db
+        research = EN28.ResearchSystem()
+        st.session_state.clear()
+        st.session_state.update({'initialized': True, 'current_participant': None,
+                                 'participant_data': research._create_template()})
+        demographics = {'nama': 'Bench', 'kelas': '11', 'usia': 16, 'pengalaman': 'Menengah'}
+        record('register', measure(lambda i: research.register(dict(demographics)), samples))
+        concepts = EN28.SNAPSHOT_CONCEPTS
+        record('update_progress',
+               measure(lambda i: research.update_progress(concepts[i % len(concepts)], i % 3 != 0), samples))
+        record('save_current_write_behind', measure(lambda i: research.save_current(), samples))
+        db.flush()
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000,10000,100000", help="comma-separated cohort sizes")
+    parser.add_argument("--backends", default="json,sqlite", help="comma-separated storage backends")
+    parser.add_argument("--samples", type=int, default=500, help="operations timed per per-document benchmark")
+    parser.add_argument("--bulk-repeats", type=int, default=3, help="repetitions of whole-cohort reads")
+    parser.add_argument("--get-all-limit", type=int, default=20000,
+                        help="skip get_all_participants (which holds every document in memory) above this size")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--keep", action="store_true", help="keep the generated data directories")
+    parser.add_argument("--log-level", default="WARNING", help="EN28 log level while benchmarking")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level)
+
+    results = []
+    for backend in args.backends.split(","):
+        for size in [int(s) for s in args.sizes.split(",")]:
+            results.extend(bench_cohort(backend, size, args))
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': vars(args),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
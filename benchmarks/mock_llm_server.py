@@ -0,0 +1,154 @@
+"""Local stand-in for the OpenRouter chat-completions endpoint.
+
+Serves POST /chat/completions (and /api/v1/chat/completions) with either a
+regular JSON body or, when the request sets "stream": true, an SSE stream
+of content deltas, so DeepSeekAI can be exercised without network access.
+
+    python benchmarks/mock_llm_server.py --port 8765 --token-delay 0.02
+
+then point the app at it in .streamlit/secrets.toml:
+
+    DEEPSEEK_API_KEY = "test"
+    DEEPSEEK_BASE_URL = "http://127.0.0.1:8765"
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TUTOR_ANSWER = (
+    "**📘 Jawaban**\n\n"
+    "Permutasi dipakai saat **urutan penting**, kombinasi saat urutan **tidak penting**.\n\n"
+    "🧩 *Analogi*: memilih ketua dan wakil (permutasi) vs memilih 2 anggota tim (kombinasi).\n\n"
+    "✍️ *Contoh*: dari 5 orang, P(5,2) = 20 dan C(5,2) = 10."
+)
+
+def mock_question(rng: random.Random) -> dict:
+    n = rng.randint(5, 15)
+    r = rng.randint(2, min(5, n - 1))
+    answer = math.comb(n, r)
+    options = sorted({answer, math.perm(n, r), n * r, answer + n})
+    return {
+        "question": f"Dari {n} siswa dipilih {r} untuk piket. Berapa cara?",
+        "options": [str(o) for o in options],
+        "answer": str(answer),
+        "explanation": f"C({n},{r}) = {answer}",
+        "hint": "Urutan tidak penting"
+    }
+
+
+class MockState:
+    def __init__(self, token_delay: float, latency: float, fail_every: int):
+        self.token_delay = token_delay
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def completion_text(payload: dict) -> str:
+    prompt = " ".join(m.get("content", "") for m in payload.get("messages", []))
+    if "JSON" in prompt:
+        rng = random.Random()
+        specs = re.findall(r"concept=(\w+); level=(\w+); count=(\d+)", prompt)
+        if specs:
+            # Batched request: one flat list tagged with concept and level
+            questions = [
+                dict(mock_question(rng), concept=concept, level=level)
+                for concept, level, count in specs for _ in range(int(count))
+            ]
+        else:
+            questions = [mock_question(rng) for _ in range(3)]
+        return "```json\n" + json.dumps({"questions": questions}, ensure_ascii=False) + "\n```"
+    return TUTOR_ANSWER
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, b"{}")
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with state.lock:
+                state.requests += 1
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+                request_number = state.requests
+            try:
+                if state.fail_every and request_number % state.fail_every == 0:
+                    self._send(429, b'{"error": "rate limited"}')
+                    return
+                time.sleep(state.latency)
+                text = completion_text(payload)
+                if payload.get("stream"):
+                    self._stream(text)
+                else:
+                    body = {"choices": [{"message": {"role": "assistant", "content": text}}]}
+                    self._send(200, json.dumps(body, ensure_ascii=False).encode("utf-8"))
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _stream(self, text: str):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(b": MOCK PROCESSING\n\n")
+            for token in text.split(" "):
+                event = {"choices": [{"delta": {"content": token + " "}}]}
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(state.token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def start_server(port: int = 0, token_delay: float = 0.02, latency: float = 0.0, fail_every: int = 0):
+    # Returns (server, state); the server runs on a daemon thread. Port 0 picks a free port.
+    state = MockState(token_delay, latency, fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with HTTP 429")
+    args = parser.parse_args()
+    server, _ = start_server(args.port, args.token_delay, args.latency, args.fail_every)
+    print(f"Mock completion server on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import atexit
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import EN28  # noqa: E402
+from mock_llm_server import start_server  # noqa: E402
+
+
+@pytest.fixture
+def mock_llm():
+    # Short latency keeps the tests fast while still overlapping concurrent calls
+    server, state = start_server(token_delay=0.001, latency=0.05)
+    yield server, state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ai(mock_llm, tmp_path, monkeypatch):
+    # Process-wide resources are replaced with per-test instances so no
+    # st.secrets lookup happens and nothing leaks between tests
+    server, _ = mock_llm
+    scheduler = EN28.LLMScheduler(max_in_flight=2, rate_per_sec=1000, burst=100, max_wait=5.0)
+    monkeypatch.setattr(EN28, "get_llm_scheduler", lambda: scheduler)
+    cache = EN28.ResponseCache(str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(EN28, "get_response_cache", lambda: cache)
+    index = EN28.TutorQuestionIndex()
+    monkeypatch.setattr(EN28, "get_tutor_index", lambda: index)
+    client = EN28.DeepSeekAI.__new__(EN28.DeepSeekAI)
+    client.api_key = "test"
+    client.base_url = f"http://127.0.0.1:{server.server_port}"
+    client.model = "mock"
+    client.demo_mode = False
+    return client
+
+
+@pytest.fixture
+def open_db(tmp_path):
+    # RealTimeDatabase registers atexit flushes; they are dropped after the test
+    # so nothing writes into removed temp directories at interpreter exit
+    opened = []
+
+    def open_db(backend="json", **kwargs):
+        db = EN28.RealTimeDatabase(str(tmp_path), backend=backend, **kwargs)
+        opened.append(db)
+        return db
+
+    yield open_db
+    for db in opened:
+        atexit.unregister(db.index.persist)
+        atexit.unregister(db.flush)
+
+
+@pytest.fixture
+def new_participant():
+    def new_participant(participant_id, **fields):
+        data = EN28.ResearchSystem._create_template(None)
+        data['participant_id'] = participant_id
+        data.update(fields)
+        return data
+    return new_participant
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request):
+    return request.param
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+
+import EN28
+
+
+def row(participant_id, pre=None, post=None, attempted=0):
+    return {'participant_id': participant_id, 'pre_anxiety': pre, 'post_anxiety': post,
+            'pre_score': None, 'post_score': None, 'problems_attempted': attempted}
+
+
+def test_rebuild_does_not_deadlock_with_the_background_persister(tmp_path):
+    index = EN28.CohortIndex(str(tmp_path / "_cohort_index.json"))
+    index.update(row("P1", 30, 20))
+    persister_holds_lock = threading.Event()
+    go = threading.Event()
+
+    def persister():
+        # The background persister's lock order: _persist_lock, then _lock
+        with index._persist_lock:
+            persister_holds_lock.set()
+            go.wait(5)
+            with index._lock:
+                pass
+
+    background = threading.Thread(target=persister, daemon=True)
+    background.start()
+    assert persister_holds_lock.wait(5)
+    rebuild = threading.Thread(target=index.rebuild, args=([row("P1", 30, 20), row("P2", 40, 25)],), daemon=True)
+    rebuild.start()
+    # Let rebuild reach persist() while the persister still holds its lock
+    time.sleep(0.1)
+    go.set()
+    background.join(5)
+    rebuild.join(5)
+
+    assert not background.is_alive() and not rebuild.is_alive()
+    with open(index.path, encoding='utf-8') as f:
+        assert {r['participant_id'] for r in json.load(f)['rows']} == {"P1", "P2"}
+    assert index.paired_stats('anxiety')['n'] == 2
+
+
+def participant(participant_id, pre_anxiety):
+    return {'participant_id': participant_id, 'anxiety_survey': {'pre_score': pre_anxiety, 'post_score': 20}}
+
+
+def persisted_rows(db):
+    with open(db.index.path, encoding='utf-8') as f:
+        return {r['participant_id']: r for r in json.load(f)['rows']}
+
+
+def test_processes_sharing_the_index_file_merge_instead_of_overwriting(open_db):
+    # Two databases on one directory stand in for two server processes
+    first = open_db()
+    second = open_db()
+    first.save_participant("P1", participant("P1", 30))
+    first.cohort_index()
+    second.cohort_index()
+
+    second.save_participant("P1", participant("P1", 45))
+    second.save_participant("P2", participant("P2", 35))
+    second.index.persist()
+    # first still holds the old P1 row and never saw P2
+    first.save_participant("P3", participant("P3", 25))
+    first.index.persist()
+
+    rows = persisted_rows(first)
+    assert sorted(rows) == ["P1", "P2", "P3"]
+    assert rows["P1"]["pre_anxiety"] == 45
+    assert first.index.rows["P1"]["pre_anxiety"] == 45
+    assert first.index.paired_stats('anxiety')['n'] == 3
+
+
+def test_saves_a_process_never_persisted_are_caught_up_on_the_next_start(open_db):
+    first = open_db()
+    second = open_db()
+    first.cohort_index()
+    second.cohort_index()
+    second.save_participant("P1", participant("P1", 30))
+    second.index.persist()
+    # second dies before persisting this save; first keeps persisting afterwards
+    time.sleep(1.5)
+    second.save_participant("P2", participant("P2", 40))
+    time.sleep(1.5)
+    first.save_participant("P3", participant("P3", 25))
+    first.index.persist(final=True)
+
+    assert "P2" not in persisted_rows(first)
+    restarted = open_db()
+    assert sorted(restarted.cohort_index().rows) == ["P1", "P2", "P3"]
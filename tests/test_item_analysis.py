@@ -0,0 +1,28 @@
+import numpy as np
+
+from EN28 import cronbach_alpha, item_analysis_table
+
+QUESTIONS = [
+    {'id': 1, 'concept': 'permutasi', 'options': ['6', '3', '9', '12'], 'correct_answer': '6'},
+    {'id': 2, 'concept': 'kombinasi', 'options': ['10', '20', '5', '15'], 'correct_answer': '10'},
+]
+
+
+def test_item_analysis_table_uses_complete_cases_only():
+    columns = {
+        'pre_q1_correct': np.array([1, 1, 0, 1, np.nan]),
+        'pre_q1_answer': np.array(['6', '6', '3', '6', '']),
+        'pre_q2_correct': np.array([1, 0, 0, 1, 1]),
+        'pre_q2_answer': np.array(['10', '20', '5', '10', '10']),
+    }
+    table = item_analysis_table(columns, QUESTIONS, 'pre')
+
+    assert table['N'].tolist() == [4, 4]
+    assert table['Tingkat Kesukaran (p)'].tolist() == [0.75, 0.5]
+    assert table.loc[0, 'Opsi A'] == "6 ✓: 75%"
+    assert table.loc[1, 'Opsi B'] == "20: 25%"
+
+
+def test_cronbach_alpha_of_identical_items_is_one():
+    items = np.array([[1, 1, 1], [2, 2, 2], [4, 4, 4], [5, 5, 5]], dtype=float)
+    assert cronbach_alpha(items) == 1.0
@@ -0,0 +1,78 @@
+import EN28
+
+
+def practice(db, participant_id, data, concept, is_correct):
+    # What ResearchSystem.update_progress does for a checked practice answer
+    EN28.apply_practice_attempt(data, concept, is_correct)
+    assert db.append_attempt(participant_id, data, concept, is_correct)
+
+
+def attempted(data):
+    return data['learning_progress']['problems_attempted']
+
+
+def test_attempts_are_journaled_and_replayed_on_load(open_db, backend, new_participant):
+    db = open_db(backend)
+    data = new_participant("P1")
+    db.save_participant("P1", data)
+    for is_correct in [True, False, True]:
+        practice(db, "P1", data, 'permutasi', is_correct)
+
+    assert attempted(db.backend.read_snapshot("P1")) == 0
+    assert [r['s'] for r in db.backend.read_journal("P1")] == [1, 2, 3]
+    loaded = open_db(backend, cache_entries=0).load_participant("P1")
+    assert attempted(loaded) == 3
+    assert loaded['learning_progress']['problems_correct'] == 2
+    assert loaded['adaptive_learning']['performance_history']['permutasi'] == {'attempts': 3, 'correct': 2}
+    assert loaded['journal_seq'] == 3
+
+
+def test_replay_skips_records_already_in_the_snapshot(open_db, backend, new_participant):
+    db = open_db(backend)
+    data = new_participant("P1")
+    db.save_participant("P1", data)
+    for _ in range(2):
+        practice(db, "P1", data, 'kombinasi', True)
+    db.save_participant("P1", data)
+    # A crash between writing the snapshot and trimming the journal leaves old records behind
+    db.backend.append_journal("P1", {'s': 2, 'c': 'kombinasi', 'ok': 1, 't': ''})
+
+    loaded = open_db(backend, cache_entries=0).load_participant("P1")
+    assert attempted(loaded) == 2
+    assert loaded['journal_seq'] == 2
+
+
+def test_journal_is_compacted_into_the_snapshot(open_db, backend, new_participant):
+    db = open_db(backend)
+    db.JOURNAL_COMPACT_EVERY = 3
+    db.WRITE_BEHIND_DELAY = 60
+    data = new_participant("P1")
+    db.save_participant("P1", data)
+    for is_correct in [True, True, False]:
+        practice(db, "P1", data, 'prinsip_perkalian', is_correct)
+    assert db.flush()
+
+    snapshot = db.backend.read_snapshot("P1")
+    assert attempted(snapshot) == 3
+    assert snapshot['journal_seq'] == 3
+    assert db.backend.read_journal("P1") == []
+
+
+def test_attempt_journaled_while_an_older_snapshot_is_queued_survives_the_flush(open_db, backend, new_participant):
+    db = open_db(backend)
+    db.WRITE_BEHIND_DELAY = 60
+    data = new_participant("P1")
+    db.save_participant("P1", data)
+    practice(db, "P1", data, 'permutasi', True)
+    practice(db, "P1", data, 'permutasi', True)
+    db.schedule_save("P1", data)
+    # Journaled after the queued snapshot (journal_seq 2) was taken
+    practice(db, "P1", data, 'permutasi', False)
+
+    assert attempted(db.load_participant("P1")) == 3
+    assert db.flush()
+    assert db.backend.read_snapshot("P1")['journal_seq'] == 2
+    assert [r['s'] for r in db.backend.read_journal("P1")] == [3]
+    loaded = open_db(backend, cache_entries=0).load_participant("P1")
+    assert attempted(loaded) == 3
+    assert loaded['learning_progress']['problems_correct'] == 2
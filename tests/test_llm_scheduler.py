@@ -0,0 +1,189 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import EN28
+from mock_llm_server import TUTOR_ANSWER
+
+
+def wait_for_queue(scheduler, depth, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while scheduler.stats()['queue_depth'] < depth:
+        assert time.monotonic() < deadline, "callers never queued"
+        time.sleep(0.005)
+
+
+def test_waiting_calls_are_admitted_in_priority_order():
+    scheduler = EN28.LLMScheduler(max_in_flight=1, rate_per_sec=1000, burst=100)
+    order = []
+
+    def call(priority):
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    scheduler.acquire(EN28.LLMScheduler.INTERACTIVE)
+    threads = []
+    # Queued lowest priority first so FIFO order alone would give the wrong answer
+    for depth, priority in enumerate([EN28.LLMScheduler.PREFETCH, EN28.LLMScheduler.INTERACTIVE,
+                                      EN28.LLMScheduler.TUTOR], start=1):
+        thread = threading.Thread(target=call, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        wait_for_queue(scheduler, depth)
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [EN28.LLMScheduler.TUTOR, EN28.LLMScheduler.INTERACTIVE, EN28.LLMScheduler.PREFETCH]
+    stats = scheduler.stats()
+    assert stats['in_flight'] == 0
+    assert stats['queue_depth'] == 0
+    assert stats['admitted'] == {'tutor': 1, 'interactive': 2, 'prefetch': 1}
+
+
+def test_call_waiting_past_max_wait_is_rejected():
+    scheduler = EN28.LLMScheduler(max_in_flight=1, rate_per_sec=1000, burst=100, max_wait=0.1)
+    with scheduler.slot(EN28.LLMScheduler.TUTOR):
+        with pytest.raises(requests.Timeout):
+            scheduler.acquire(EN28.LLMScheduler.PREFETCH)
+    stats = scheduler.stats()
+    assert stats['rejected'] == 1
+    assert stats['queue_depth'] == 0
+    # The rejected caller left no trace: the next call is admitted at once
+    with scheduler.slot(EN28.LLMScheduler.PREFETCH):
+        assert scheduler.stats()['in_flight'] == 1
+
+
+def test_api_calls_never_exceed_max_in_flight(ai, mock_llm):
+    _, state = mock_llm
+    messages = [{"role": "user", "content": "Apa itu permutasi?"}]
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        answers = list(executor.map(lambda _: ai._call_api(messages), range(6)))
+
+    assert answers == [TUTOR_ANSWER] * 6
+    assert state.requests == 6
+    assert state.max_in_flight <= EN28.get_llm_scheduler().max_in_flight
+
+
+def test_tutor_stream_yields_deltas_and_caches_the_answer(ai, mock_llm):
+    _, state = mock_llm
+    chunks = list(ai.ask_tutor_stream("Apa beda permutasi dan kombinasi?", "permutasi"))
+
+    assert chunks[0] == "🤖 **AI Tutor:**\n\n"
+    assert len(chunks) > 2
+    assert "".join(chunks[1:]).strip() == TUTOR_ANSWER
+    assert EN28.get_llm_scheduler().stats()['in_flight'] == 0
+
+    # The completed answer is served from the cache without another request
+    again = list(ai.ask_tutor_stream("Apa beda permutasi dan kombinasi?", "permutasi"))
+    assert state.requests == 1
+    assert again == ["🤖 **AI Tutor:**\n\n" + "".join(chunks[1:])]
+
+
+def test_tutor_stream_falls_back_when_the_scheduler_rejects(ai, mock_llm):
+    _, state = mock_llm
+    scheduler = EN28.get_llm_scheduler()
+    scheduler.max_wait = 0.1
+    scheduler.acquire(EN28.LLMScheduler.PREFETCH)
+    scheduler.acquire(EN28.LLMScheduler.PREFETCH)
+    try:
+        chunks = list(ai.ask_tutor_stream("Apa itu faktorial?", "faktorial"))
+    finally:
+        scheduler.release()
+        scheduler.release()
+
+    assert chunks == ["🤖 **AI Tutor:** Tidak dapat menghubungi AI. Contoh: Untuk faktorial, coba buat diagram pohon."]
+    assert state.requests == 0
+    # Failed streams are not cached, so the next ask reaches the server
+    assert "".join(ai.ask_tutor_stream("Apa itu faktorial?", "faktorial")).strip().endswith(TUTOR_ANSWER)
+    assert state.requests == 1
+
+
+def test_single_flight_shares_one_result_and_one_error():
+    flights = EN28.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise requests.ConnectionError("down")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flights.do, "k", compute)
+        started.wait(5)
+        followers = [executor.submit(flights.do, "k", compute) for _ in range(3)]
+        deadline = time.monotonic() + 5
+        while flights.followers < 3 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        release.set()
+        for future in [leader] + followers:
+            with pytest.raises(requests.ConnectionError):
+                future.result(5)
+
+    assert len(calls) == 1
+    assert (flights.leaders, flights.followers) == (1, 3)
+    # The key is free again once the flight lands
+    assert flights.do("k", lambda: "ok") == "ok"
+
+
+class Rerun(BaseException):
+    # Stands in for Streamlit's RerunException/StopException
+    pass
+
+
+def test_single_flight_does_not_share_control_flow_exceptions():
+    flights = EN28.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def interrupted():
+        started.set()
+        release.wait(5)
+        raise Rerun()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flights.do, "k", interrupted)
+        started.wait(5)
+        followers = [executor.submit(flights.do, "k", lambda: "own result") for _ in range(3)]
+        deadline = time.monotonic() + 5
+        while flights.followers < 3 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        release.set()
+        with pytest.raises(Rerun):
+            leader.result(5)
+        # Followers retry instead of receiving the leader's rerun
+        assert [future.result(5) for future in followers] == ["own result"] * 3
+
+
+def test_shared_explanation_failure_is_reported_in_every_callers_session(ai, mock_llm, monkeypatch):
+    _, state = mock_llm
+    warnings = []
+    monkeypatch.setattr(EN28, "_ui_warning", lambda message: warnings.append(threading.get_ident()))
+    scheduler = EN28.get_llm_scheduler()
+    scheduler.max_wait = 0.3
+    scheduler.acquire(EN28.LLMScheduler.PREFETCH)
+    scheduler.acquire(EN28.LLMScheduler.PREFETCH)
+    callers = []
+
+    def explain(_):
+        callers.append(threading.get_ident())
+        return ai.get_explanation("permutasi", "beginner")
+
+    try:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            explanations = list(executor.map(explain, range(3)))
+    finally:
+        scheduler.release()
+        scheduler.release()
+
+    fallback = EN28.PRE_GENERATED_EXPLANATIONS["permutasi"]["beginner"]
+    assert explanations == [fallback] * 3
+    assert state.requests == 0
+    # One warning per caller, each raised on that caller's own thread
+    assert sorted(warnings) == sorted(callers)
@@ -0,0 +1,54 @@
+import json
+import logging
+
+import EN28
+
+
+def ai_question(i, concept=None, level=None):
+    question = {"question": f"Soal AI {i}", "options": ["1", "2", "3", "4"], "answer": "2",
+                "explanation": "", "hint": ""}
+    if concept is not None:
+        question["concept"] = concept
+    if level is not None:
+        question["level"] = level
+    return question
+
+
+def reply_with(monkeypatch, ai, questions):
+    response = json.dumps({"questions": questions})
+    monkeypatch.setattr(ai, "_call_api", lambda *args, **kwargs: response)
+
+
+def from_ai(questions):
+    return sum(q["question"].startswith("Soal AI") for q in questions)
+
+
+def test_display_name_tags_are_matched_to_their_specs(ai, monkeypatch):
+    reply_with(monkeypatch, ai, [ai_question(0, "Permutasi", "Beginner"), ai_question(1, " permutasi ", "Pemula"),
+                                 ai_question(2, "Prinsip Perkalian", "Menengah"),
+                                 ai_question(3, "prinsip-perkalian", "INTERMEDIATE")])
+    results = ai.generate_question_batch([("permutasi", "beginner", 2), ("prinsip_perkalian", "intermediate", 2)])
+
+    assert from_ai(results[("permutasi", "beginner")]) == 2
+    assert from_ai(results[("prinsip_perkalian", "intermediate")]) == 2
+    # Complete sets are cached under the keys cached_questions reads
+    assert from_ai(ai.cached_questions("permutasi", "beginner", 2)) == 2
+
+
+def test_single_spec_batch_accepts_untagged_questions(ai, monkeypatch):
+    reply_with(monkeypatch, ai, [ai_question(0), ai_question(1, "Permutations", "easy"), ai_question(2)])
+    results = ai.generate_question_batch([("permutasi", "advanced", 3)])
+
+    assert from_ai(results[("permutasi", "advanced")]) == 3
+
+
+def test_unrecognized_tags_are_dropped_and_logged(ai, monkeypatch, caplog):
+    reply_with(monkeypatch, ai, [ai_question(0, "kombinasi", "advanced"), ai_question(1, "statistika", "advanced"),
+                                 ai_question(2)])
+    with caplog.at_level(logging.WARNING):
+        results = ai.generate_question_batch([("kombinasi", "advanced", 2), ("permutasi", "advanced", 1)])
+
+    kombinasi = results[("kombinasi", "advanced")]
+    assert len(kombinasi) == 2 and from_ai(kombinasi) == 1
+    assert from_ai(results[("permutasi", "advanced")]) == 0
+    assert "Dropped 2/3 batch questions" in caplog.text
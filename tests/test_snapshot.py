@@ -0,0 +1,40 @@
+import numpy as np
+
+import EN28
+
+
+def assert_same_columns(left, right):
+    assert sorted(left) == sorted(right)
+    for column in left:
+        if left[column].dtype.kind == 'f':
+            np.testing.assert_array_equal(left[column], right[column])
+        else:
+            assert left[column].tolist() == right[column].tolist(), column
+
+
+def test_incremental_export_rereads_only_changed_participants(tmp_path, open_db, new_participant):
+    db = open_db("json")
+    documents = {}
+    for pid, anxiety in [("P1", 30), ("P2", 40), ("P3", 50)]:
+        documents[pid] = new_participant(pid, demographics={'nama': pid, 'kelas': '11', 'usia': 16})
+        documents[pid]['anxiety_survey']['pre_score'] = anxiety
+        db.save_participant(pid, documents[pid])
+    out_dir = str(tmp_path / "_snapshot")
+    assert EN28.export_columnar_snapshot(db, out_dir) == {'participants': 3, 'reflattened': 3}
+    assert EN28.export_columnar_snapshot(db, out_dir) == {'participants': 3, 'reflattened': 0}
+
+    # A full save, a journal-only change and a new participant
+    documents["P2"]['post_test']['score'] = 80
+    db.save_participant("P2", documents["P2"])
+    EN28.apply_practice_attempt(documents["P3"], 'permutasi', True)
+    db.append_attempt("P3", documents["P3"], 'permutasi', True)
+    db.save_participant("P0", new_participant("P0", demographics={'nama': 'P0 dengan nama yang jauh lebih panjang'}))
+
+    assert EN28.export_columnar_snapshot(db, out_dir) == {'participants': 4, 'reflattened': 3}
+    merged = EN28.load_columnar_snapshot(out_dir, mmap=False)
+    assert merged['participant_id'].tolist() == ["P0", "P1", "P2", "P3"]
+    assert merged['post_score'].tolist()[2] == 80
+    assert merged['permutasi_attempts'].tolist()[3] == 1
+    # Same columns as exporting everything from scratch
+    EN28.export_columnar_snapshot(db, str(tmp_path / "full"))
+    assert_same_columns(merged, EN28.load_columnar_snapshot(str(tmp_path / "full"), mmap=False))
@@ -0,0 +1,47 @@
+import pytest
+
+import EN28
+
+PARAPHRASES = [
+    ("apa bedanya permutasi dan kombinasi?", "apa beda permutasi dengan kombinasi?"),
+    ("Apa perbedaan permutasi dan kombinasi?", "perbedaan permutasi dengan kombinasi apa ya?"),
+    ("kapan pakai permutasi dan kapan pakai kombinasi?", "kapan harus pakai permutasi, kapan kombinasi?"),
+    ("Bagaimana cara menghitung P(8,3)?", "gimana cara hitung P(8,3)?"),
+    ("kenapa 0! sama dengan 1?", "mengapa 0! = 1?"),
+    ("apa itu permutasi siklis?", "permutasi siklis itu apa?"),
+    ("kok rumus kombinasi dibagi r faktorial?", "kenapa rumus kombinasi dibagi r!?"),
+    ("ada lima orang duduk melingkar, berapa susunannya?", "ada 5 orang duduk melingkar, berapa susunannya?"),
+]
+
+DIFFERENT_QUESTIONS = [
+    ("Bagaimana cara menghitung P(8,3)?", "Bagaimana cara menghitung P(9,3)?"),
+    ("Bagaimana cara menghitung P(8,3)?", "Bagaimana cara menghitung P(3,8)?"),
+    ("Bagaimana cara menghitung P(8,3)?", "Bagaimana cara menghitung C(8,3)?"),
+    ("berapa C(10,2)?", "berapa C(10,3)?"),
+    ("ada 5 orang duduk melingkar, berapa susunannya?", "ada 6 orang duduk melingkar, berapa susunannya?"),
+    ("apa itu permutasi siklis?", "apa itu permutasi dengan unsur yang sama?"),
+    ("kapan pakai permutasi?", "kapan pakai kombinasi?"),
+    ("apa rumus permutasi?", "apa rumus kombinasi?"),
+]
+
+
+@pytest.mark.parametrize("cached, asked", PARAPHRASES)
+def test_paraphrase_is_answered_from_the_cached_question(cached, asked):
+    index = EN28.TutorQuestionIndex()
+    index.add(cached, "permutasi", "key")
+    match = index.lookup(asked, "permutasi")
+    assert match is not None and match['cache_key'] == "key"
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT_QUESTIONS)
+def test_question_with_other_numbers_or_topic_is_not_matched(cached, asked):
+    index = EN28.TutorQuestionIndex()
+    index.add(cached, "permutasi", "key")
+    assert index.lookup(asked, "permutasi") is None
+
+
+def test_matches_stay_within_their_context():
+    index = EN28.TutorQuestionIndex()
+    index.add("apa itu faktorial?", "permutasi", "key")
+    assert index.lookup("apa itu faktorial?", "kombinasi") is None
+    assert index.stats()['hits'] == 0
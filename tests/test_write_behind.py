@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+import EN28
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def db(request, tmp_path):
+    database = EN28.RealTimeDatabase(str(tmp_path), backend=request.param)
+    # Only explicit flush() calls write pending documents in these tests
+    database.WRITE_BEHIND_DELAY = 60
+    return database
+
+
+def on_disk(db, participant_id):
+    # Bypasses the pending queue and the cache
+    return db.backend.read_snapshot(participant_id)
+
+
+def test_stale_flush_never_overwrites_a_newer_synchronous_save(db, monkeypatch):
+    db.schedule_save("P1", {"participant_id": "P1", "value": "deferred"})
+    batch_taken = threading.Event()
+    resume = threading.Event()
+    write = db._write
+
+    def gated_write(participant_id, data, generation):
+        # Hold the flusher between taking its batch and writing it
+        if data["value"] == "deferred":
+            batch_taken.set()
+            resume.wait(5)
+        write(participant_id, data, generation)
+
+    monkeypatch.setattr(db, "_write", gated_write)
+    flusher = threading.Thread(target=db.flush)
+    flusher.start()
+    assert batch_taken.wait(5)
+    assert db.save_participant("P1", {"participant_id": "P1", "value": "synchronous"})
+    resume.set()
+    flusher.join(5)
+
+    assert db.load_participant("P1")["value"] == "synchronous"
+    assert on_disk(db, "P1")["value"] == "synchronous"
+    assert db._pending == {}
+
+
+def test_synchronous_save_supersedes_a_pending_write(db):
+    db.schedule_save("P1", {"participant_id": "P1", "value": "deferred"})
+    assert db.load_participant("P1")["value"] == "deferred"
+    assert db.save_participant("P1", {"participant_id": "P1", "value": "synchronous"})
+    assert db._pending == {}
+    assert db.flush()
+    assert on_disk(db, "P1")["value"] == "synchronous"
+
+
+def test_flush_writes_only_the_latest_scheduled_document(db):
+    for value in ["first", "second", "third"]:
+        db.schedule_save("P1", {"participant_id": "P1", "value": value})
+    assert on_disk(db, "P1") is None
+    assert db.flush()
+    assert on_disk(db, "P1")["value"] == "third"